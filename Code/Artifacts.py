@@ -0,0 +1,244 @@
+import json
+import os
+import pickle
+import shutil
+
+import numpy
+
+from ColumnSets import ColumnMask, MaskColumns
+
+#On-disk format for the pipeline's results
+#
+#Every result is a directory holding a manifest.json and one .npy file per array, so a reader can
+#memory-map the arrays instead of unpickling whole objects:
+#  MC sets: masks.npy, one row of packed column bits per set (column c is bit c % 8 of byte c // 8,
+#    i.e. numpy.unpackbits(masks, axis=1, bitorder="little") gives the set/column incidence matrix)
+#  deidentified distinguishers: the distinct MC sets as packed masks plus, for every (set, row)
+#    entry, its set and row index; the symbols of all distinguishers are one flat int array,
+#    cut into distinguishers by form_offsets and into entries by entry_offsets
+#  entropy matrices: the float64 matrix as matrix.npy, the MC set of each column as packed masks,
+#    and the plat row labels in the manifest
+#The loaders return light wrappers around the mapped arrays; sets and distinguishers are only
+#turned into Python objects when they are indexed. Older .dump pickles are still read.
+
+FORMAT_VERSION = 1
+
+
+def _WriteArtifact(path, kind, arrays, meta):
+    #write into a temporary directory and rename it, so readers never see a half-written result
+    tmp = path + ".tmp"
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+    for name, array in arrays.items():
+        numpy.save(os.path.join(tmp, name + ".npy"), array)
+
+    manifest = dict(meta, kind=kind, version=FORMAT_VERSION, arrays=sorted(arrays))
+    with open(os.path.join(tmp, "manifest.json"), "w", encoding="utf8") as out:
+        json.dump(manifest, out)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp, path)
+
+
+def _ReadArtifact(path, kind, mmap=True):
+    with open(os.path.join(path, "manifest.json"), encoding="utf8") as manifestfile:
+        manifest = json.load(manifestfile)
+    if manifest.get("kind") != kind or manifest.get("version") != FORMAT_VERSION:
+        raise ValueError("%s holds %s version %s, not %s version %d" % (path, manifest.get("kind"), manifest.get("version"), kind, FORMAT_VERSION))
+
+    arrays = {}
+    for name in manifest["arrays"]:
+        arrays[name] = numpy.load(os.path.join(path, name + ".npy"), mmap_mode="r" if mmap else None)
+    return manifest, arrays
+
+
+def _LoadPickle(path):
+    with open(path, "rb") as dumpfile:
+        return pickle.load(dumpfile)
+
+
+##Packs column bitmasks into a (sets x bytes) uint8 array, bit c % 8 of byte c // 8 standing for column c
+def PackMasks(masks, columns):
+    width = (columns + 7) // 8
+    packed = numpy.zeros((len(masks), width), dtype=numpy.uint8)
+    for i, mask in enumerate(masks):
+        packed[i] = numpy.frombuffer(mask.to_bytes(width, "little"), dtype=numpy.uint8)
+    return(packed)
+
+
+class PackedSets:
+    """Read-only sequence of column sets stored as packed bitmasks
+
+    Indexing and iteration give frozensets of column indices, as the MC
+    set scripts produce; mask(i) gives the set as an int bitmask and
+    incidence() the boolean set/column matrix.
+    """
+
+    def __init__(self, bits, columns):
+        self.bits = bits
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.bits)
+
+    def mask(self, i):
+        return int.from_bytes(self.bits[i].tobytes(), "little")
+
+    def __getitem__(self, i):
+        return MaskColumns(self.mask(i))
+
+    def __iter__(self):
+        for i in range(len(self.bits)):
+            yield self[i]
+
+    def incidence(self):
+        return numpy.unpackbits(self.bits, axis=1, count=self.columns, bitorder="little").astype(bool)
+
+
+##Returns the column bitmasks of an iterable of column sets, and the number of columns they span
+def _SetMasks(sets):
+    masks = [ColumnMask(s) for s in sets]
+    columns = max([m.bit_length() for m in masks], default=0)
+    return masks, columns
+
+
+##Writes MC sets (an iterable of column sets) to the directory path, ordered by their sorted columns
+def SaveMCSets(path, mcsets):
+    masks, columns = _SetMasks(sorted(mcsets, key=sorted))
+    _WriteArtifact(path, "mcsets", {"masks": PackMasks(masks, columns)}, {"columns": columns, "count": len(masks)})
+
+
+##Returns the MC sets saved at path as a PackedSets (or the set of frozensets of an old .dump file)
+def LoadMCSets(path, mmap=True):
+    if os.path.isfile(path):
+        return _LoadPickle(path)
+    manifest, arrays = _ReadArtifact(path, "mcsets", mmap)
+    return PackedSets(arrays["masks"], manifest["columns"])
+
+
+class DeidentifiedDists:
+    """Read-only sequence of (mcset, row, distinguishers) entries
+
+    Entry k gives the same triple as ExtractDeidentifiedDists.GetDists:
+    the MC set as a frozenset, the plat row index and one list of symbols
+    per form. forms(k) gives the symbols as slices of the mapped array
+    instead, without copying.
+    """
+
+    def __init__(self, sets, entry_set, entry_row, entry_offsets, form_offsets, values):
+        self.sets = sets
+        self.entry_set = entry_set
+        self.entry_row = entry_row
+        self.entry_offsets = entry_offsets
+        self.form_offsets = form_offsets
+        self.values = values
+
+    def __len__(self):
+        return len(self.entry_set)
+
+    def forms(self, k):
+        first, last = self.entry_offsets[k], self.entry_offsets[k + 1]
+        return [self.values[self.form_offsets[f]:self.form_offsets[f + 1]] for f in range(first, last)]
+
+    def __getitem__(self, k):
+        return self.sets[int(self.entry_set[k])], int(self.entry_row[k]), [form.tolist() for form in self.forms(k)]
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self[k]
+
+
+##Returns a list of non-negative ints as an array of the narrowest of int16, int32 and int64 that holds them
+def _IntArray(values):
+    largest = max(values, default=0)
+    for dtype in (numpy.int16, numpy.int32, numpy.int64):
+        if largest <= numpy.iinfo(dtype).max:
+            return numpy.array(values, dtype=dtype)
+    raise ValueError("value %d does not fit in 64 bits" % largest)
+
+
+##Writes the (mcset, row, distinguishers) triples of ExtractDeidentifiedDists.GetDists to the directory path
+def SaveDeidentifiedDists(path, dists):
+    setindex = {}
+    entry_set = []
+    entry_row = []
+    entry_offsets = [0]
+    form_offsets = [0]
+    values = []
+
+    for mcset, r, e in dists:
+        entry_set.append(setindex.setdefault(frozenset(mcset), len(setindex)))
+        entry_row.append(r)
+        for form in e:
+            values.extend(form)
+            form_offsets.append(len(values))
+        entry_offsets.append(len(form_offsets) - 1)
+
+    masks, columns = _SetMasks(setindex)
+    arrays = {
+        "sets": PackMasks(masks, columns),
+        "entry_set": _IntArray(entry_set),
+        "entry_row": _IntArray(entry_row),
+        "entry_offsets": _IntArray(entry_offsets),
+        "form_offsets": _IntArray(form_offsets),
+        "values": _IntArray(values),
+    }
+    _WriteArtifact(path, "deidentified_dists", arrays, {"columns": columns, "count": len(entry_set)})
+
+
+##Returns the deidentified distinguishers saved at path as a DeidentifiedDists (or the list of an old .dump file)
+def LoadDeidentifiedDists(path, mmap=True):
+    if os.path.isfile(path):
+        return _LoadPickle(path)
+    manifest, arrays = _ReadArtifact(path, "deidentified_dists", mmap)
+    return DeidentifiedDists(PackedSets(arrays["sets"], manifest["columns"]), arrays["entry_set"], arrays["entry_row"],
+                             arrays["entry_offsets"], arrays["form_offsets"], arrays["values"])
+
+
+class EntropyMatrix:
+    """Entropy matrix with its labels
+
+    matrix is the (plat rows x MC sets) float64 array, rows the plat row
+    labels and columns the MC set of each column as a PackedSets.
+    """
+
+    def __init__(self, matrix, rows, columns):
+        self.matrix = matrix
+        self.rows = rows
+        self.columns = columns
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+
+##Writes an entropy matrix to the directory path; rows are the plat row labels and columns the MC set of each column
+def SaveEntropyMatrix(path, matrix, rows, columns):
+    matrix = numpy.ascontiguousarray(matrix, dtype=numpy.float64)
+    masks, width = _SetMasks(columns)
+    if matrix.shape != (len(rows), len(masks)):
+        raise ValueError("matrix of shape %s does not match %d row and %d column labels" % (matrix.shape, len(rows), len(masks)))
+    _WriteArtifact(path, "entropymatrix", {"matrix": matrix, "columns": PackMasks(masks, width)}, {"rows": list(rows), "width": width})
+
+
+##Returns the entropy matrix saved at path as an EntropyMatrix
+##An old .dump file has no labels: its rows are labelled by index and its columns are None
+def LoadEntropyMatrix(path, mmap=True):
+    if os.path.isfile(path):
+        matrix = _LoadPickle(path)
+        return EntropyMatrix(matrix, [str(r) for r in range(len(matrix))], None)
+    manifest, arrays = _ReadArtifact(path, "entropymatrix", mmap)
+    return EntropyMatrix(arrays["matrix"], manifest["rows"], PackedSets(arrays["columns"], manifest["width"]))
+
+
+##Copies a saved result directory to another path
+def CopyArtifact(src, dst):
+    tmp = dst + ".tmp"
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+    shutil.copytree(src, tmp)
+    if os.path.exists(dst):
+        shutil.rmtree(dst)
+    os.replace(tmp, dst)
@@ -0,0 +1,569 @@
+import csv
+import os
+import sys
+import time
+import random
+import tracemalloc
+import multiprocessing
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from EditDistanceWithAlignment import GetPairwiseThemes, GetDistinguishers
+from ColumnSets import MaskColumns, MaximalSets
+from aStar_matching import MaxMatchNode, aStar_match, extractMatch, search_stats
+import Legacy
+
+#Benchmarks for the performance-sensitive parts of the pipeline
+#Usage: python Benchmarks.py <benchmark> [arguments]
+#Every measurement runs in a fresh process so that peak memory figures are not polluted by earlier runs
+
+##Peak resident set size of the current process in kilobytes, or None where the resource module is unavailable
+def PeakRSS():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak = peak // 1024
+    return peak
+
+
+def _Measure(func, args, results, trace):
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    peak = None
+    if trace:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak = peak // 1024
+    results.put((elapsed, peak, PeakRSS()))
+
+
+def _RunMeasure(func, args, trace):
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    proc = ctx.Process(target=_Measure, args=(func, args, results, trace))
+    proc.start()
+    measurement = results.get()
+    proc.join()
+    return measurement
+
+
+##Runs func(*args) in a fresh process and returns (seconds, peak traced KB, peak RSS KB)
+##Tracing allocations slows allocation-heavy code down a lot, so the time comes from a second, untraced run
+def MeasureInSubprocess(func, args):
+    elapsed, none, rss = _RunMeasure(func, args, False)
+    traced, peak, tracedrss = _RunMeasure(func, args, True)
+    return elapsed, peak, rss
+
+
+##Random forms over a small alphabet; repeated characters give many optimal alignments, as clitics and reduplicated affixes do
+def RandomForms(length, count, seed=0, alphabet="aeinorst"):
+    rnd = random.Random(seed)
+    return ["".join([rnd.choice(alphabet) for c in range(length)]) for f in range(count)]
+
+
+def PrintTable(header, rows):
+    print("\t".join(header))
+    for row in rows:
+        print("\t".join([str(val) for val in row]))
+
+
+###############################################################################
+#alignment: recursive EditDistanceWithAlignment against the DAG engine
+
+def LegacyThemesAndDistinguishers(forms):
+    for form1 in forms:
+        for form2 in forms:
+            mincost, solutions = Legacy.EditDistanceWithAlignment(form1, form2)
+            themes = set(["".join([char for (char, alt) in al1 if alt]) for (al1, al2) in solutions])
+            for theme in themes:
+                mincost, solutions = Legacy.EditDistanceWithAlignment(theme, form2)
+                set(["".join([char for (char, alt) in al2 if not alt]) for (al1, al2) in solutions])
+
+
+def EngineThemesAndDistinguishers(forms):
+    for form1 in forms:
+        for form2 in forms:
+            for theme in GetPairwiseThemes(form1, form2):
+                GetDistinguishers(theme, form2)
+
+
+##Times themes and distinguishers for every pair of forms as form length grows
+##Usage: python Benchmarks.py alignment [maxlength] [forms per length]
+def BenchmarkAlignment(args):
+    maxlength = int(args[0]) if len(args) > 0 else 16
+    count = int(args[1]) if len(args) > 1 else 6
+    table = []
+    for length in range(4, maxlength + 1, 2):
+        forms = RandomForms(length, count, seed=length)
+        for name, func in [("recursive", LegacyThemesAndDistinguishers), ("dag", EngineThemesAndDistinguishers)]:
+            elapsed, traced, rss = MeasureInSubprocess(func, (forms,))
+            table.append((length, name, "%.3f" % elapsed, traced, rss))
+    PrintTable(("length", "engine", "seconds", "peak traced KB", "peak RSS KB"), table)
+
+
+###############################################################################
+#antichain: permutations-based maximality filter against MaximalSets
+
+##Runs both filters on the same column sets and checks they agree
+def TimeMaximalFilters(comps):
+    compsets = [set(MaskColumns(comp)) for comp in comps]
+
+    start = time.perf_counter()
+    legacy = Legacy.MaximalFilter(compsets)
+    legacytime = time.perf_counter() - start
+
+    start = time.perf_counter()
+    maximal = MaximalSets(comps).masks()
+    antichaintime = time.perf_counter() - start
+
+    assert set([MaskColumns(m) for m in maximal]) == set([frozenset(s) for s in legacy])
+    return len(comps), len(set(comps)), len(maximal), "%.5f" % legacytime, "%.5f" % antichaintime
+
+
+def ReadPlat(file):
+    with open(file, encoding="utf8") as csvfile:
+        csvreader = csv.reader(csvfile, delimiter=',')
+        next(csvreader, None)
+        return list(csvreader)
+
+
+##Times the maximality filter of CompareTwoRows on the theme combinations of real row pairs
+##Usage: python Benchmarks.py antichain plat.csv [number of rows]
+def BenchmarkAntichain(args):
+    import MaximallyConfusableSubsets as mcs
+    rows = ReadPlat(args[0])[:int(args[1]) if len(args) > 1 else 6]
+    tables = mcs.GetDistinguisherTables(rows, mcs.GetLargestSetsbyTheme(rows))
+
+    table = []
+    for i in range(len(rows)):
+        for j in range(i + 1, len(rows)):
+            comps = [mcs.CompareTwoSets(tables[i][t1], tables[j][t2]) for t1 in tables[i] for t2 in tables[j]]
+            comps = [comp for comp in comps if comp]
+            table.append((rows[i][0], rows[j][0]) + TimeMaximalFilters(comps))
+
+    #synthetic row pairs with more theme combinations than the plat provides: random subsets of a few
+    #large column sets over 60 columns, as produced by rows with many stem alternants
+    rnd = random.Random(0)
+    for count in (250, 500, 1000, 2000):
+        bases = [rnd.getrandbits(60) for b in range(8)]
+        comps = [rnd.choice(bases) & rnd.getrandbits(60) & rnd.getrandbits(60) | 1 for c in range(count)]
+        table.append(("synthetic", "-") + TimeMaximalFilters(comps))
+
+    PrintTable(("row1", "row2", "combinations", "distinct", "maximal", "permutations s", "antichain s"), table)
+
+
+###############################################################################
+#artifacts: whole-object pickles against the memory-mapped result format
+
+def _DirSize(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum([os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)])
+
+
+##Times writing and opening synthetic MC sets, deidentified distinguishers and entropy matrices of growing size
+##Usage: python Benchmarks.py artifacts [plat rows]
+def BenchmarkArtifacts(args):
+    import pickle
+    import tempfile
+    import numpy
+    from Artifacts import SaveMCSets, LoadMCSets, SaveDeidentifiedDists, LoadDeidentifiedDists, SaveEntropyMatrix, LoadEntropyMatrix
+
+    nrows = int(args[0]) if len(args) > 0 else 200
+    rnd = random.Random(0)
+    table = []
+    tmpdir = tempfile.mkdtemp()
+    for count in (500, 2000, 8000):
+        mcsets = set([MaskColumns(rnd.getrandbits(60) | 3) for c in range(count)])
+        dists = [(s, r, [[rnd.randrange(12) for k in range(rnd.randint(1, 4))] for col in s]) for s in list(mcsets)[:count // 20] for r in range(nrows)]
+        matrix = numpy.random.RandomState(0).rand(nrows, len(mcsets))
+        rowlabels = [str(r) for r in range(nrows)]
+
+        for name, obj, save, load in [
+                ("mcsets", mcsets, lambda p: SaveMCSets(p, mcsets), LoadMCSets),
+                ("deidentified_dists", dists, lambda p: SaveDeidentifiedDists(p, dists), LoadDeidentifiedDists),
+                ("entropymatrix", matrix, lambda p: SaveEntropyMatrix(p, matrix, rowlabels, mcsets), LoadEntropyMatrix)]:
+            dump = os.path.join(tmpdir, name + ".dump")
+            path = os.path.join(tmpdir, name)
+
+            start = time.perf_counter()
+            pickle.dump(obj, open(dump, "wb"))
+            picklesave = time.perf_counter() - start
+            start = time.perf_counter()
+            pickle.load(open(dump, "rb"))
+            pickleload = time.perf_counter() - start
+
+            start = time.perf_counter()
+            save(path)
+            artifactsave = time.perf_counter() - start
+            start = time.perf_counter()
+            load(path)
+            artifactload = time.perf_counter() - start
+
+            table.append((name, len(obj), _DirSize(dump), _DirSize(path), "%.4f" % picklesave, "%.4f" % artifactsave, "%.5f" % pickleload, "%.5f" % artifactload))
+
+    PrintTable(("result", "entries", "pickle bytes", "artifact bytes", "pickle save s", "artifact save s", "pickle open s", "artifact open s"), table)
+
+
+###############################################################################
+#fullmatch: aStar_match against fullMatch for deciding whether every column of two rows matches
+
+##Deidentifies a list of distinguishers by giving every character an id shared by all its occurrences
+def CharacterEncoding(dists):
+    ids = {}
+    return [[ids.setdefault(char, len(ids)) for char in d] for d in dists]
+
+
+##Times the full-match decision on every pair of plat rows for random sets of columns
+##Each row's distinguishers for a set are deidentified by character identity (see CharacterEncoding)
+##Usage: python Benchmarks.py fullmatch plat.csv [number of column sets]
+def BenchmarkFullMatch(args):
+    from aStar_matching import extractMatch, fullMatch
+
+    rows = ReadPlat(args[0])
+    nsets = int(args[1]) if len(args) > 1 else 10
+    rnd = random.Random(0)
+    table = []
+    for s in range(nsets):
+        mcset = range(rnd.randint(2, 8))
+        setdists = RandomSetDists(rows, len(mcset), rnd)
+
+        pairs = [(i, j) for i in range(len(rows) - 1) for j in range(i + 1, len(rows))]
+
+        start = time.perf_counter()
+        searched = []
+        for i, j in pairs:
+            mx = MaxMatchNode(0, [setdists[i], setdists[j]], [0 for x in range(len(mcset))])
+            searched.append(len(extractMatch(aStar_match(mx, verbose=0))) == len(mcset))
+        searchtime = time.perf_counter() - start
+
+        start = time.perf_counter()
+        decided = [fullMatch(setdists[i], setdists[j]) for i, j in pairs]
+        decidetime = time.perf_counter() - start
+
+        assert searched == decided
+        table.append((len(mcset), len(pairs), sum(decided), "%.4f" % searchtime, "%.5f" % decidetime))
+
+    PrintTable(("columns", "row pairs", "full matches", "aStar_match s", "fullMatch s"), table)
+
+
+###############################################################################
+#matchnodes: the original aStar_matching search nodes against the compact ones
+
+def LegacyMatchAll(setdists, ncols):
+    for rowA in setdists:
+        for rowB in setdists:
+            queue = Legacy.PriorityQueue()
+            best = Legacy.MaxMatchNode(0, [rowA, rowB], [0 for x in range(ncols)])
+            while not best.complete():
+                for succ in best.successors():
+                    queue.update(succ)
+                best = queue.popMin()
+
+
+def CompactMatchAll(setdists, ncols):
+    for rowA in setdists:
+        for rowB in setdists:
+            aStar_match(MaxMatchNode(0, [rowA, rowB], [0 for x in range(ncols)]))
+
+
+##Deidentified distinguishers of every plat row for a random set of columns, encoded by character identity
+def RandomSetDists(rows, ncols, rnd):
+    from EditDistanceWithAlignment import ExtractThemesforSet
+    mcset = sorted(rnd.sample(range(1, len(rows[0])), ncols))
+    setdists = []
+    for row in rows:
+        forms = [row[col] for col in mcset]
+        theme = sorted(ExtractThemesforSet(forms))[0]
+        setdists.append(CharacterEncoding([sorted(GetDistinguishers(theme, form))[0] for form in forms]))
+    return setdists
+
+
+##Times aStar_match on every ordered pair of plat rows for random column sets of growing size, with the original
+##and the compact search nodes, and reports nodes expanded per second and peak memory
+##Usage: python Benchmarks.py matchnodes plat.csv [number of rows]
+def BenchmarkMatchNodes(args):
+    rows = ReadPlat(args[0])[:int(args[1]) if len(args) > 1 else 20]
+    rnd = random.Random(0)
+    table = []
+    for ncols in (4, 8, 16, 32, 48):
+        setdists = RandomSetDists(rows, ncols, rnd)
+
+        #both node types expand the same nodes, so count them once here
+        search_stats["expanded"] = 0
+        CompactMatchAll(setdists, ncols)
+        expanded = search_stats["expanded"]
+
+        for name, func in [("original", LegacyMatchAll), ("compact", CompactMatchAll)]:
+            elapsed, traced, rss = MeasureInSubprocess(func, (setdists, ncols))
+            table.append((ncols, name, expanded, "%.3f" % elapsed, int(expanded / elapsed), traced))
+
+    PrintTable(("columns", "nodes", "expanded", "seconds", "expanded/s", "peak traced KB"), table)
+
+
+###############################################################################
+#matchbounds: admissible bounds and column orders for the aStar_matching search
+
+##Runs aStar_match on every ordered pair of rows with the given options; returns the size of each best match
+def MatchAllWith(setdists, ncols, bound, order):
+    sizes = []
+    for rowA in setdists:
+        for rowB in setdists:
+            best = aStar_match(MaxMatchNode(0, [rowA, rowB], [0 for x in range(ncols)], bound=bound, order=order))
+            sizes.append(len(extractMatch(best)))
+    return sizes
+
+
+##Compares the nodes expanded and time of aStar_match with each bound and column order on every ordered pair of
+##plat rows, for random column sets of 20 columns and more
+##Usage: python Benchmarks.py matchbounds plat.csv [number of rows]
+def BenchmarkMatchBounds(args):
+    rows = ReadPlat(args[0])[:int(args[1]) if len(args) > 1 else 20]
+    rnd = random.Random(0)
+    table = []
+    for ncols in (20, 32, 48):
+        setdists = RandomSetDists(rows, ncols, rnd)
+        reference = None
+        for bound in ("count", "cliques"):
+            for order in ("plat", "constrained"):
+                search_stats["expanded"] = 0
+                start = time.perf_counter()
+                sizes = MatchAllWith(setdists, ncols, bound, order)
+                elapsed = time.perf_counter() - start
+
+                #every admissible bound and order finds matches of the same size
+                if reference is None:
+                    reference = sizes
+                assert sizes == reference
+                table.append((ncols, bound, order, search_stats["expanded"], "%.3f" % elapsed))
+
+    PrintTable(("columns", "bound", "order", "expanded", "seconds"), table)
+
+
+###############################################################################
+#matchers: the backends of Matchers.py on matching problems from the plat
+
+##The matching problems of a deidentified run on rows: every distinct pair of deidentified distinguisher lists that
+##FindMaximallyConfusableSubsets_Deidentified hands to MaxMatch, in the order it first does
+def HarvestMatchProblems(rows, seed=0):
+    import io
+    import contextlib
+    import MaximallyConfusableSubsets_Deidentified as deidentified
+
+    problems = {}
+    match = deidentified.MaxMatch
+    def Record(rowA, rowB, matcher="astar"):
+        problems.setdefault((tuple(map(tuple, rowA)), tuple(map(tuple, rowB))), (rowA, rowB))
+        return match(rowA, rowB, matcher)
+
+    deidentified.MaxMatch = Record
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            deidentified.FindMaximallyConfusableSubsets_Deidentified(rows, seed=seed)
+    finally:
+        deidentified.MaxMatch = match
+    return list(problems.values())
+
+
+##Times each backend of Matchers.py (and "auto") on the matching problems of a deidentified run on the first rows
+##of the plat (see HarvestMatchProblems), grouped by number of columns, and checks that they all find matches of the
+##same size; at most the given number of problems is drawn from each group
+##Usage: python Benchmarks.py matchers plat.csv [number of rows] [problems per group]
+def BenchmarkMatchers(args):
+    from Matchers import MaxMatch, AlphabetSize, ChooseMatcher
+
+    rows = ReadPlat(args[0])[:int(args[1]) if len(args) > 1 else 4]
+    pergroup = int(args[2]) if len(args) > 2 else 40
+    problems = HarvestMatchProblems(rows)
+    rnd = random.Random(0)
+    table = []
+    lowest = 1
+    for highest in (2, 4, 8, 12, 16, 24, 32, 48, max([len(rowA) for rowA, rowB in problems] + [64])):
+        group = [(rowA, rowB) for rowA, rowB in problems if lowest <= len(rowA) <= highest]
+        columns = "%d-%d" % (lowest, highest)
+        lowest = highest + 1
+        if not group:
+            continue
+        pairs = rnd.sample(group, min(pergroup, len(group)))
+        alphabet = sorted([AlphabetSize(rowA, rowB) for rowA, rowB in pairs])[len(pairs) // 2]
+        picks = set([ChooseMatcher(rowA, rowB) for rowA, rowB in pairs])
+
+        times = {}
+        sizes = {}
+        for matcher in ("astar", "ilp", "bnb", "auto"):
+            start = time.perf_counter()
+            sizes[matcher] = [len(MaxMatch(rowA, rowB, matcher)) for rowA, rowB in pairs]
+            times[matcher] = (time.perf_counter() - start) / len(pairs) * 1000
+            assert sizes[matcher] == sizes["astar"]
+
+        fastest = min(("astar", "ilp", "bnb"), key=times.get)
+        table.append((columns, len(group), len(pairs), alphabet) + tuple(["%.3f" % times[m] for m in ("astar", "ilp", "bnb", "auto")]) +
+                     (fastest, "/".join(sorted(picks))))
+
+    PrintTable(("columns", "problems", "timed", "median alphabet", "astar ms", "ilp ms", "bnb ms", "auto ms", "fastest", "auto picks"), table)
+
+
+##Times maxUnifiedMatching with and without its presolve on row pairs of the plat (columns cut to the shorter
+##length, as MatchILP does) for random column sets of growing size, and reports how the presolve split the work
+##Usage: python Benchmarks.py presolve plat.csv [number of row pairs]
+def BenchmarkPresolve(args):
+    import pulp
+    from maxunifiedmatching import maxUnifiedMatching, presolve_stats
+
+    rows = ReadPlat(args[0])
+    npairs = int(args[1]) if len(args) > 1 else 30
+    rnd = random.Random(0)
+    table = []
+    for ncols in (4, 8, 16, 32, 48):
+        setdists = RandomSetDists(rows, ncols, rnd)
+        pairs = []
+        for k in range(npairs):
+            rowA, rowB = rnd.sample(setdists, 2)
+            pairs.append(tuple(zip(*[(colA[:len(colB)], colB[:len(colA)]) for colA, colB in zip(rowA, rowB)])))
+
+        start = time.perf_counter()
+        legacy = [len(Legacy.maxUnifiedMatching(list(rowA), list(rowB), pulp.PULP_CBC_CMD(msg=False))) for rowA, rowB in pairs]
+        legacytime = time.perf_counter() - start
+
+        for stat in presolve_stats:
+            presolve_stats[stat] = 0
+        start = time.perf_counter()
+        presolved = [len(maxUnifiedMatching(list(rowA), list(rowB), pulp.PULP_CBC_CMD(msg=False))) for rowA, rowB in pairs]
+        presolvedtime = time.perf_counter() - start
+
+        assert legacy == presolved
+        table.append((ncols, npairs, "%.1f" % (legacytime / npairs * 1000), "%.2f" % (presolvedtime / npairs * 1000),
+                      presolve_stats["dropped"], presolve_stats["fixed"], presolve_stats["direct"], presolve_stats["solved"]))
+
+    PrintTable(("columns", "pairs", "original ms", "presolved ms", "dropped", "fixed", "direct groups", "solver runs"), table)
+
+
+###############################################################################
+#incremental: merging distinguishers into an alignment one at a time, as approximateMultialign does
+
+def LegacyMergeAll(dists):
+    extracted = [list(range(len(dists[0]), 0, -1))]
+    for ii in range(1, len(dists)):
+        Legacy.incrementalMerge(dists[ii], ii, dists[:ii], extracted)
+    return extracted
+
+
+def MergeAll(dists):
+    from approximateMultialign import IncrementalAlignment
+
+    alignment = IncrementalAlignment(dists[:1], [list(range(len(dists[0]), 0, -1))])
+    for ii in range(1, len(dists)):
+        alignment.merge(dists[ii])
+    return alignment.extracted()
+
+
+##Times merging the distinguishers of a plat row for random sets of 10 to 60 columns into an alignment one at a
+##time, longest first, starting from the longest one alone, with the original and the current incremental merge
+##Usage: python Benchmarks.py incremental plat.csv [lists per size]
+def BenchmarkIncremental(args):
+    from EditDistanceWithAlignment import ExtractThemesforSet
+    import approximateMultialign #imported before timing, so that the first merges do not pay for it
+
+    rows = ReadPlat(args[0])
+    nlists = int(args[1]) if len(args) > 1 else 20
+    rnd = random.Random(0)
+    table = []
+    for ncols in (10, 20, 30, 40, 50, 60):
+        lists = []
+        while len(lists) < nlists:
+            row = rnd.choice(rows)
+            forms = [row[col] for col in rnd.sample(range(1, len(row)), min(ncols, len(row) - 1))]
+            theme = sorted(ExtractThemesforSet(forms))[0]
+            dists = sorted([rnd.choice(sorted(GetDistinguishers(theme, form))) for form in forms], key=len, reverse=True)
+            if dists[0]:
+                lists.append(dists)
+
+        merged = sum([len(dists) - 1 for dists in lists])
+        start = time.perf_counter()
+        legacy = [LegacyMergeAll(dists) for dists in lists]
+        legacytime = time.perf_counter() - start
+
+        start = time.perf_counter()
+        current = [MergeAll(dists) for dists in lists]
+        currenttime = time.perf_counter() - start
+
+        assert legacy == current
+        table.append((ncols, nlists, merged, int(merged / legacytime), int(merged / currenttime)))
+
+    PrintTable(("entries", "lists", "merges", "original merges/s", "current merges/s"), table)
+
+
+###############################################################################
+#confusable: counting confusable rows for the entropy matrix with an index against comparing every pair of rows
+
+##Candidate distinguishers of n lexemes, made from the candidates of the plat rows on one set of columns
+##"resampled" gives each lexeme the candidates of a random row, as lexemes of one inflection class share them;
+##"recombined" takes each column of each candidate from a different random candidate, so almost every lexeme differs
+def LexemeSetDists(setdists, n, workload, rnd):
+    if workload == "resampled":
+        return [rnd.choice(setdists) for r in range(n)]
+
+    pool = [cand for rowdists in setdists for cand in rowdists]
+    return [[[rnd.choice(pool)[d] for d in range(len(pool[0]))] for c in range(rnd.randint(1, 2))] for r in range(n)]
+
+
+##Times CountConfusableRows and CountConfusableRows_Pairwise as the number of lexemes grows, on random sets of
+##columns of the plat; the pairwise count only runs up to the given number of lexemes
+##Usage: python Benchmarks.py confusable plat.csv [largest number of lexemes for the pairwise count]
+def BenchmarkConfusable(args):
+    from EntropyCalculations import GetSetDists, CountConfusableRows, CountConfusableRows_Pairwise
+
+    rows = ReadPlat(args[0])
+    pairwiseUpTo = int(args[1]) if len(args) > 1 else 2000
+    rnd = random.Random(0)
+    table = []
+    for ncols in (3, 12):
+        setdists = GetSetDists(sorted(rnd.sample(range(1, len(rows[0])), ncols)), rows)
+        for workload in ("resampled", "recombined"):
+            for n in (250, 500, 1000, 2000, 4000, 8000):
+                lexemes = LexemeSetDists(setdists, n, workload, rnd)
+
+                start = time.perf_counter()
+                indexed = CountConfusableRows(lexemes)
+                indexedtime = time.perf_counter() - start
+
+                pairwisetime = "-"
+                if n <= pairwiseUpTo:
+                    start = time.perf_counter()
+                    pairwise = CountConfusableRows_Pairwise(lexemes)
+                    pairwisetime = "%.3f" % (time.perf_counter() - start)
+                    assert indexed == pairwise
+
+                table.append((ncols, workload, n, (sum(indexed) - n) // 2, "%.3f" % indexedtime, pairwisetime))
+
+    PrintTable(("columns", "lexemes", "rows", "confusable pairs", "indexed s", "pairwise s"), table)
+
+
+benchmarks = {
+    "alignment": BenchmarkAlignment,
+    "antichain": BenchmarkAntichain,
+    "artifacts": BenchmarkArtifacts,
+    "fullmatch": BenchmarkFullMatch,
+    "matchbounds": BenchmarkMatchBounds,
+    "matchnodes": BenchmarkMatchNodes,
+    "matchers": BenchmarkMatchers,
+    "presolve": BenchmarkPresolve,
+    "incremental": BenchmarkIncremental,
+    "confusable": BenchmarkConfusable,
+}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in benchmarks:
+        print("Usage: python Benchmarks.py <benchmark> [arguments]")
+        print("Benchmarks:", ", ".join(sorted(benchmarks)))
+        sys.exit(1)
+
+    benchmarks[sys.argv[1]](sys.argv[2:])
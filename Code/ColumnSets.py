@@ -0,0 +1,114 @@
+#Column sets as bitmasks
+#
+#MC set discovery works with sets of plat column indices. A plat has a few
+#dozen columns, so a column set is stored as a Python int with bit c set when
+#column c is in the set: intersections, subset tests and hashing are then
+#single integer operations. Column sets are converted back to frozensets only
+#when results leave MC set discovery (e.g. to be saved).
+
+try:
+    PopCount = int.bit_count
+except AttributeError:
+    def PopCount(x):
+        return bin(x).count("1")
+
+
+##Returns the bitmask of an iterable of column indices
+def ColumnMask(cols):
+    mask = 0
+    for col in cols:
+        mask |= 1 << col
+    return(mask)
+
+
+##Returns the frozenset of column indices in a bitmask
+def MaskColumns(mask):
+    cols = []
+    col = 0
+    while mask:
+        if mask & 1:
+            cols.append(col)
+        mask >>= 1
+        col += 1
+    return(frozenset(cols))
+
+
+##Number of columns in a bitmask
+def MaskSize(mask):
+    return(PopCount(mask))
+
+
+##Whether every column of mask a is also in mask b
+def IsSubmask(a, b):
+    return(a & b == a)
+
+
+class MaximalSets:
+    """Antichain of column bitmasks under inclusion
+
+    add() rejects a mask that is contained in (or equal to) a member and
+    evicts every member contained in the newcomer, so the members are
+    always exactly the maximal masks added so far, whatever the insertion
+    order. Members are bucketed by size: a mask can only be contained in
+    larger members and can only contain smaller ones.
+    """
+
+    def __init__(self, masks=()):
+        self.members = {} #mask -> size, in insertion order
+        self.bysize = {} #size -> set of masks
+        for mask in masks:
+            self.add(mask)
+
+    def __len__(self):
+        return len(self.members)
+
+    def __iter__(self):
+        return iter(self.members)
+
+    def __contains__(self, mask):
+        return mask in self.members
+
+    def add(self, mask):
+        """Adds mask unless a member contains it; returns whether it was added"""
+        if mask in self.members:
+            return False
+
+        size = PopCount(mask)
+        for other_size, others in self.bysize.items():
+            if other_size > size:
+                for other in others:
+                    if mask & other == mask:
+                        return False
+
+        for other_size, others in self.bysize.items():
+            if other_size < size:
+                dominated = [other for other in others if other & mask == other]
+                for other in dominated:
+                    others.discard(other)
+                    del self.members[other]
+
+        self.members[mask] = size
+        self.bysize.setdefault(size, set()).add(mask)
+        return True
+
+    def masks(self):
+        """The maximal masks, in the order they were added"""
+        return list(self.members)
+
+
+##Returns every intersection of one or more of the given masks that has at least minsize columns
+##Each mask is intersected once with the closure built so far, so the cost is polynomial in the size of the
+##output rather than exponential in the number of masks
+def IntersectionClosure(masks, minsize=1):
+    closure = set()
+    for mask in masks:
+        if PopCount(mask) < minsize or mask in closure:
+            continue
+        found = set([mask])
+        for other in closure:
+            inter = mask & other
+            if inter and PopCount(inter) >= minsize:
+                found.add(inter)
+        closure.update(found)
+
+    return(closure)
@@ -0,0 +1,417 @@
+#Alignment engine for pairs of forms
+#
+#Insertions and deletions cost 1 and substitutions cost 2, so a substitution is
+#never cheaper than deleting and inserting, and the optimal alignments of two
+#forms are exactly the embeddings of their longest common subsequences. Rather
+#than recursing on every prefix pair and materialising every alignment at every
+#cell, the engine fills a longest-common-subsequence table bottom-up once per
+#pair of forms and keeps only the DAG of matched character pairs that lie on an
+#optimal alignment. Alignments, themes and distinguishers are then read off
+#that DAG iteratively.
+
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+from ColumnSets import PopCount
+
+
+class AlignmentCache:
+    """Bounded least-recently-used memo for pairwise alignment results
+
+    maxentries: largest number of entries kept (None for no bound)
+    maxbytes: largest estimated resident size in bytes (None for no bound)
+
+    The cache keeps its own hit, miss and eviction counters. It is safe to
+    use from several threads, and from worker processes: a pickled cache
+    arrives empty with the same bounds, and a forked cache keeps its warm
+    entries but starts counting afresh, so per-worker statistics can be
+    summed with MergeCacheStats without double counting.
+    """
+
+    def __init__(self, maxentries=200000, maxbytes=None):
+        self.maxentries = maxentries
+        self.maxbytes = maxbytes
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.nbytes = 0
+        self.resetStats()
+
+    def resetStats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.pid = os.getpid()
+
+    def __getstate__(self):
+        return {"maxentries": self.maxentries, "maxbytes": self.maxbytes}
+
+    def __setstate__(self, state):
+        self.__init__(state["maxentries"], state["maxbytes"])
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def checkProcess(self):
+        if self.pid != os.getpid():
+            self.lock = threading.Lock()
+            self.resetStats()
+
+    def get(self, key, default=None):
+        self.checkProcess()
+        with self.lock:
+            value = self.entries.get(key, default)
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return value
+
+    def put(self, key, value):
+        self.checkProcess()
+        size = EstimateSize(key) + EstimateSize(value)
+        if self.maxbytes is not None and size > self.maxbytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self.nbytes -= self.sizes[key]
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            self.sizes[key] = size
+            self.nbytes += size
+
+            while self.entries and ((self.maxentries is not None and len(self.entries) > self.maxentries) or
+                                    (self.maxbytes is not None and self.nbytes > self.maxbytes)):
+                old, oldval = self.entries.popitem(last=False)
+                self.nbytes -= self.sizes.pop(old)
+                self.evictions += 1
+
+    def stats(self):
+        #a forked process reports its own lookups, even if it has made none
+        self.checkProcess()
+        lookups = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "bytes": self.nbytes,
+                "hitrate": self.hits / lookups if lookups else 0.0}
+
+    def __str__(self):
+        return FormatCacheStats(self.stats())
+
+
+##One-line summary of the statistics of a cache (or of several, merged by MergeCacheStats)
+def FormatCacheStats(st):
+    return "%d hits, %d misses (%.1f%% hit rate), %d evictions, %d entries, ~%d KB resident" % (
+        st["hits"], st["misses"], 100 * st["hitrate"], st["evictions"], st["entries"], st["bytes"] // 1024)
+
+
+##Combines the statistics reported by several caches (e.g. one per worker process)
+def MergeCacheStats(allStats):
+    merged = {"hits": 0, "misses": 0, "evictions": 0, "entries": 0, "bytes": 0}
+    for st in allStats:
+        for kk in merged:
+            merged[kk] += st[kk]
+    lookups = merged["hits"] + merged["misses"]
+    merged["hitrate"] = merged["hits"] / lookups if lookups else 0.0
+    return merged
+
+
+##Rough resident size in bytes of a cache key or value made of strings, tuples and sets
+def EstimateSize(obj):
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (tuple, list, set, frozenset)):
+        for item in obj:
+            if isinstance(item, str):
+                size += sys.getsizeof(item)
+            else:
+                size += EstimateSize(item)
+    return size
+
+
+##Reads a cache bound from the environment; unset means the default, 0 or "none" means unbounded
+def CacheBound(name, default):
+    val = os.environ.get(name)
+    if val is None:
+        return default
+    if val.lower() in ("0", "none"):
+        return None
+    return int(val)
+
+
+#shared by every module that imports the alignment functions
+#bounds can be set with ALIGNMENT_CACHE_ENTRIES and ALIGNMENT_CACHE_BYTES
+cache = AlignmentCache(CacheBound("ALIGNMENT_CACHE_ENTRIES", 200000), CacheBound("ALIGNMENT_CACHE_BYTES", None))
+
+
+##Replaces the bounds of the shared cache, dropping its current contents
+def ConfigureCache(maxentries=200000, maxbytes=None):
+    cache.maxentries = maxentries
+    cache.maxbytes = maxbytes
+    cache.clear()
+
+##Builds the DAG of matched character pairs for two forms
+##Returns the number of matched characters, the DAG levels and the successors of every node:
+##levels[k] holds the pairs (i, j) with s1[i]==s2[j] that are followed by exactly k further matches
+##in some optimal alignment; succ[None] holds the first matches of every optimal alignment
+def AlignmentDAG(s1, s2):
+    n = len(s1)
+    m = len(s2)
+
+    #bit-parallel LCS over the reversed forms: bit b of rows[a] is clear when the LCS of the last a
+    #characters of s1 and the last b+1 characters of s2 is longer than with the last b characters
+    rev2 = s2[::-1]
+    full = (1 << m) - 1
+    masks = {}
+    for b, char in enumerate(rev2):
+        masks[char] = masks.get(char, 0) | (1 << b)
+
+    rows = [full]
+    for char in reversed(s1):
+        v = rows[-1]
+        u = v & masks.get(char, 0)
+        rows.append(((v + u) | (v - u)) & full)
+
+    #candidates[k] holds the matched pairs followed by an LCS of length k
+    matched = m - PopCount(rows[n])
+    candidates = [[] for k in range(matched)]
+    positions = {}
+    for j, char in enumerate(s2):
+        positions.setdefault(char, []).append(j)
+    for i, char in enumerate(s1):
+        v = rows[n - i - 1]
+        for j in positions.get(char, ()):
+            b = m - j - 1
+            after = b - PopCount(v & ((1 << b) - 1))
+            candidates[after].append((i, j))
+
+    #keep only the candidates reachable from the start; those are the matches on an optimal alignment
+    succ = {}
+    succ[None] = candidates[matched - 1] if matched else []
+    levels = [[] for k in range(matched)]
+    if matched:
+        levels[matched - 1] = succ[None]
+    for k in range(matched - 1, 0, -1):
+        reached = set()
+        for (i, j) in levels[k]:
+            succ[(i, j)] = [(i2, j2) for (i2, j2) in candidates[k - 1] if i2 > i and j2 > j]
+            reached.update(succ[(i, j)])
+        levels[k - 1] = [node for node in candidates[k - 1] if node in reached]
+    if matched:
+        for node in levels[0]:
+            succ[node] = []
+
+    return matched, levels, succ
+
+
+##Turns a path of matched pairs into the pair of alignments used throughout the pipeline
+def BuildAlignment(s1, s2, path):
+    matched1 = set([i for (i, j) in path])
+    matched2 = set([j for (i, j) in path])
+    alignment1 = tuple([(char, ix in matched1) for ix, char in enumerate(s1)])
+    alignment2 = tuple([(char, ix in matched2) for ix, char in enumerate(s2)])
+    return alignment1, alignment2
+
+
+##Lazily yields every optimal alignment of two forms, each exactly once
+##dag is AlignmentDAG(s1, s2), if the caller has already built it
+def IterAlignments(s1, s2, dag=None):
+    matched, levels, succ = dag if dag is not None else AlignmentDAG(s1, s2)
+    if matched == 0:
+        yield BuildAlignment(s1, s2, [])
+        return
+
+    path = []
+    stack = [iter(succ[None])]
+    while stack:
+        node = next(stack[-1], None)
+        if node is None:
+            stack.pop()
+            if path:
+                path.pop()
+        elif succ[node]:
+            path.append(node)
+            stack.append(iter(succ[node]))
+        else:
+            path.append(node)
+            yield BuildAlignment(s1, s2, path)
+            path.pop()
+
+
+##Returns the distinct strings read off every optimal alignment of s1 and s2
+##keep="theme" collects the matched characters, keep="residue" the unmatched characters of s2
+##Strings are combined level by level up the DAG, so only distinct strings are ever stored
+def CollectStrings(s1, s2, keep):
+    matched, levels, succ = AlignmentDAG(s1, s2)
+    if matched == 0:
+        return set([""]) if keep == "theme" else set([s2])
+
+    strings = {}
+    for k in range(matched):
+        for (i, j) in levels[k]:
+            if k == 0:
+                strings[(i, j)] = set([s1[i]]) if keep == "theme" else set([s2[j + 1:]])
+            else:
+                found = set()
+                for (i2, j2) in succ[(i, j)]:
+                    head = s1[i] if keep == "theme" else s2[j + 1:j2]
+                    for tail in strings[(i2, j2)]:
+                        found.add(head + tail)
+                strings[(i, j)] = found
+
+        #the level below is only needed while building this one
+        if k >= 1:
+            for node in levels[k - 1]:
+                del strings[node]
+
+    result = set()
+    for (i, j) in succ[None]:
+        head = "" if keep == "theme" else s2[:j]
+        for tail in strings[(i, j)]:
+            result.add(head + tail)
+
+    return result
+
+
+##Memoised wrapper around CollectStrings; only the distinct strings are cached
+def CachedStrings(s1, s2, keep):
+    if keep == "theme":
+        #when one string contains the other as a subsequence, it is the only theme; no need to cache that
+        if CheckThemeValidity(s1, s2):
+            return frozenset([s1])
+        if CheckThemeValidity(s2, s1):
+            return frozenset([s2])
+        #the themes of a pair do not depend on its order
+        if s2 < s1:
+            s1, s2 = s2, s1
+    key = (keep, s1, s2)
+    strings = cache.get(key)
+    if strings is None:
+        strings = frozenset(CollectStrings(s1, s2, keep))
+        cache.put(key, strings)
+    return strings
+
+
+##Returns minimum edit distance and all possible alignments for a pair of forms
+##Kept for callers that need the full alignments; the pipeline itself only needs themes and distinguishers
+def EditDistanceWithAlignment(s1, s2, level=0):
+    dag = AlignmentDAG(s1, s2)
+    mincost = len(s1) + len(s2) - 2 * dag[0]
+    return mincost, set(IterAlignments(s1, s2, dag))
+
+
+##Returns list of all possible themes for a pair of forms
+def GetPairwiseThemes(form1, form2):
+    return(list(CachedStrings(form1, form2, "theme")))
+
+
+##Returns boolean value indicating whether a given theme is valid for a particular form
+##A theme is valid when every optimal alignment of theme and form gives back the theme, i.e. when
+##every LCS of theme and form is the theme itself. That holds exactly when theme is a subsequence of
+##form: then the LCS is the whole theme, and otherwise every LCS is shorter than the theme. So a
+##two-pointer subsequence test with early exit gives the same answer without aligning anything.
+def CheckThemeValidity(theme, form):
+    remaining = iter(form)
+    for char in theme:
+        if char not in remaining:
+            return(False)
+
+    return(True)
+
+
+##Batched CheckThemeValidity: returns the indices of the forms for which theme is valid
+##start gives the index of the first form, e.g. start=1 for a plat row whose first cell is the class label
+def GetValidForms(theme, forms, start=0):
+    valid = []
+    for ix, form in enumerate(forms, start):
+        remaining = iter(form)
+        if all(char in remaining for char in theme):
+            valid.append(ix)
+
+    return(valid)
+
+
+##Given a theme and a form, returns the corresponding distinguisher in string format
+def GetDistinguishers(theme, form):
+    if CheckThemeValidity(theme, form)==False:
+        print("Error:", theme, "is not a theme for", form)
+    else:
+        return(set(CachedStrings(theme, form, "residue")))
+
+
+##Given a distinguisher and a form, returns the corresponding theme in string format
+def GetThemes(dist, form):
+    return(set(CachedStrings(dist, form, "residue")))
+
+
+#counters for the theme closure, accumulated over every call
+closure_stats = {"closures": 0, "rounds": 0, "alignments": 0, "themes": 0}
+
+
+##What this process has added to closure_stats since before (a copy of it); see AddClosureStats
+def ClosureStatsSince(before):
+    return {kk: closure_stats[kk] - before[kk] for kk in closure_stats}
+
+
+##Adds counts another process (e.g. a worker) reported with ClosureStatsSince to closure_stats
+def AddClosureStats(counts):
+    for kk in closure_stats:
+        closure_stats[kk] += counts[kk]
+
+
+##Returns every theme obtainable from a list of forms: the pairwise themes of the forms, closed under
+##taking pairwise themes of themes. Each newly found theme is aligned exactly once against every theme
+##already in the closure, and duplicates are dropped on insertion.
+##Themes shorter than minlength are dropped (their own themes can only be shorter), and the closure
+##stops growing once it holds maxthemes themes.
+def ThemeClosure(forms, minlength=0, maxthemes=None):
+    closure_stats["closures"] += 1
+    seen = set()
+    frontier = []
+    for i in range(len(forms)-1):
+        for j in range(i+1, len(forms)):
+            closure_stats["alignments"] += 1
+            for p in GetPairwiseThemes(forms[i], forms[j]):
+                if p not in seen and len(p) >= minlength:
+                    seen.add(p)
+                    frontier.append(p)
+
+    themes = []
+    while frontier and (maxthemes is None or len(themes) < maxthemes):
+        closure_stats["rounds"] += 1
+        newthemes = []
+        for t in frontier:
+            if maxthemes is not None and len(themes) >= maxthemes:
+                break
+            for old in themes:
+                closure_stats["alignments"] += 1
+                for p in GetPairwiseThemes(t, old):
+                    if p not in seen and len(p) >= minlength:
+                        seen.add(p)
+                        newthemes.append(p)
+            themes.append(t)
+        frontier = newthemes
+
+    closure_stats["themes"] += len(themes)
+    return(set(themes))
+
+
+##Given a set of forms, returns all possible themes for that set
+def ExtractThemesforSet(s):
+    themes = set()
+    for p in ThemeClosure(s):
+        if len(GetValidForms(p, s))==len(s):
+            themes.add(p)
+
+    return(themes)
@@ -1,146 +1,366 @@
-import pickle
-import csv
-import sys
-import numpy
-import math
-
-from MaximallyConfusableSubsets import GetDistinguishers, GetPairwiseThemes, CheckThemeValidity
-from maxunifiedmatching import *
-from aStar_matching import *
-from itertools import combinations
-
-##Given a theme and a list of forms, returns a corresponding list of distinguishers
-def GetDistinguishersforSet(theme, formlist):
-    distinguishers = []
-    for form in formlist:
-        distinguishers.append(GetDistinguishers(theme, form))
-        
-    return(distinguishers)
-    
-
-##Given a set of forms, returns all possible themes for that set
-def ExtractThemesforSet(s):
-    pairwisethemes = set()
-    for i in range(len(s)-1):
-        for j in range(i+1, len(s)):
-            pthemes = GetPairwiseThemes(s[i], s[j])
-            for p in pthemes:
-                pairwisethemes.add(p)
-                
-    possiblethemes = set()
-    newthemes = pairwisethemes
-    while newthemes:
-        usefulpairs = combinations(newthemes, 2)
-        possiblethemes.update(newthemes)
-        newthemes = set()
-        for a, b in usefulpairs:
-            pairthemes = GetPairwiseThemes(a, b)
-            for t in pairthemes:
-                if t not in possiblethemes:
-                    newthemes.add(t)
-    
-    themes = set()
-    for p in possiblethemes:
-        flag = False
-        for form in s:
-            if CheckThemeValidity(p, form)==False:
-                flag = True
-        
-        if flag==False:
-            themes.add(p)
-    
-    return(themes)
-    
-def CalculateEntropy(mcsets, plat):
-    matrix = numpy.zeros(((len(plat)), len(mcsets)))
-    
-    for mcset_ix in range(len(mcsets)):
-        setdists = []
-        counts = []
-        mcset = mcsets.pop()
-        for r in range(len(plat)):
-            rowforms = []
-            rowdists = []
-            for ix,col_id in enumerate(mcset):
-                rowforms.append(plat[r][col_id])
-            rowthemes = ExtractThemesforSet(rowforms)
-            for t in rowthemes:
-                rowdists.append(GetDistinguishersforSet(t, rowforms))
-            setdists.append(rowdists)
-    
-        counts = [1 for c in range(len(plat))]
-    
-        for i,j in ((i,j) for i in range(len(plat)-1) for j in range(i+1, len(plat))): #iterate through all combinations of rows
-            for i_dists, j_dists in ((i_dists, j_dists) for i_dists in setdists[i] for j_dists in setdists[j]): #iterate through all possible distinguisher sets
-                match = True
-
-                for d in range(len(i_dists)): #iterate through the forms in a given distinguisher set
-                    if not i_dists[d].intersection(j_dists[d]):
-                        match = False
-            
-                if match==True:
-                    counts[i]+=1
-                    counts[j]+=1
-                    break
-    
-        for val in range(len(counts)):
-            matrix[val][mcset_ix] = math.log(counts[val], 2)
-            
-        #print("entropy for mcset", mcset_ix, "done")
-
-    return(matrix)
-    
-    
-def CalculateEntropy_Deidentified(plat, dists):
-    matrix = numpy.zeros(((len(plat)), len(dists)))
-    
-    for mcset_ix, mcset in enumerate(dists):
-        #print("mcset:", mcset)
-        setdists = dists[mcset]
-        #print("set dists:", setdists)
-        
-        counts = [1 for c in range(len(plat))]
-        
-        for i,j in ((i,j) for i in range(len(plat)-1) for j in range(i+1, len(plat))):
-            match = True
-            
-            mx = MaxMatchNode(0, [setdists[i], setdists[j]], [0 for x in range(len(mcset))])
-            match_result = aStar_match(mx, verbose=0)
-            matchcols = extractMatch(match_result)
-            
-            if len(matchcols)!=len(mcset):
-                match = False
-                
-            if match==True:
-                counts[i]+=1
-                counts[j]+=1  
-        
-        #print("counts:", counts)
-            
-        for val in range(len(counts)):
-            matrix[val][mcset_ix] = math.log(counts[val], 2)
-            
-        #print("entropy values:", matrix[:, mcset_ix])
-        #print("entropy for mcset", mcset_ix, "done")
-            
-    return(matrix)
-
-
-##User must provide plat as a .csv file, mcsets as a .dump file, and deidentified distinguishers as a .dump file
-if __name__ == "__main__":
-    file = sys.argv[1]
-    mcsets = pickle.load(open(sys.argv[2], "rb"))
-    dists = pickle.load(open(sys.argv[3], "rb"))
-
-    with open(file, encoding="utf8") as csvfile:
-        csvreader = csv.reader(csvfile, delimiter=',')
-        next(csvreader, None)
-        plat = list(csvreader)
-           
-        #for normal mcsets 
-        matrix1 = CalculateEntropy(mcsets, plat)
-        pickle.dump(matrix1, open("entropymatrix.dump", "wb"))
-        
-        #for deidentified mcsets
-        matrix2 = CalculateEntropy_Deidentified(plat, dists)
-        pickle.dump(matrix2, open("entropymatrix_deidentified.dump", "wb"))
+import argparse
+import csv
+import os
+import tempfile
+import time
+import numpy
+import math
+from itertools import product
+
+from MaximallyConfusableSubsets import GetDistinguishers, GetPairwiseThemes, CheckThemeValidity, ExtractThemesforSet, closure_stats, cache
+from EditDistanceWithAlignment import MergeCacheStats, FormatCacheStats, ClosureStatsSince, AddClosureStats
+from Artifacts import LoadMCSets, LoadDeidentifiedDists, SaveEntropyMatrix
+from ParallelRows import MapRows
+from SearchCore import SnapshotSearchCounters, SearchCountersSince, AddSearchCounters
+from maxunifiedmatching import *
+from aStar_matching import *
+
+##Given a theme and a list of forms, returns a corresponding list of distinguishers
+def GetDistinguishersforSet(theme, formlist):
+    distinguishers = []
+    for form in formlist:
+        distinguishers.append(GetDistinguishers(theme, form))
+        
+    return(distinguishers)
+    
+
+##For every row of plat, returns the candidate distinguishers of its forms on mcset: one list of distinguisher sets
+##(one set per column) for each theme of the row's forms
+def GetSetDists(mcset, plat):
+    setdists = []
+    for r in range(len(plat)):
+        rowforms = []
+        rowdists = []
+        for ix,col_id in enumerate(mcset):
+            rowforms.append(plat[r][col_id])
+        rowthemes = ExtractThemesforSet(rowforms)
+        for t in sorted(rowthemes):
+            rowdists.append(GetDistinguishersforSet(t, rowforms))
+        setdists.append(rowdists)
+
+    return(setdists)
+
+
+##For the candidate distinguishers of every row on one MC set (see GetSetDists), returns for every row 1 + the number
+##of other rows that share a distinguisher with it on every column for some pair of their candidates,
+##comparing every pair of rows
+def CountConfusableRows_Pairwise(setdists):
+    counts = [1 for c in range(len(setdists))]
+
+    for i,j in ((i,j) for i in range(len(setdists)-1) for j in range(i+1, len(setdists))): #iterate through all combinations of rows
+        for i_dists, j_dists in ((i_dists, j_dists) for i_dists in setdists[i] for j_dists in setdists[j]): #iterate through all possible distinguisher sets
+            match = True
+
+            for d in range(len(i_dists)): #iterate through the forms in a given distinguisher set
+                if not i_dists[d].intersection(j_dists[d]):
+                    match = False
+
+            if match==True:
+                counts[i]+=1
+                counts[j]+=1
+                break
+
+    return(counts)
+
+
+#largest number of index keys one candidate may have in CountConfusableRows
+MAX_INDEX_KEYS = 64
+
+##Same counts as CountConfusableRows_Pairwise, from an index instead of comparing every pair of rows
+##Rows with the same candidates match the same rows, and are counted as one class. Each distinct candidate is indexed
+##under every combination of its distinguishers on a few key columns: the most varied columns for which no candidate
+##has more than MAX_INDEX_KEYS combinations. Candidates that match share a distinguisher on every column, so they
+##share a key; only candidates under a shared key are compared on all columns, and pairs of rows with no key in common
+##are never looked at. Where every column of every candidate holds one distinguisher, the keys are the candidates
+##This keeps the count close to linear in the number of rows, for plats of thousands of lexemes
+def CountConfusableRows(setdists):
+    classes = {}
+    for r, rowdists in enumerate(setdists):
+        #a candidate with an empty column matches nothing
+        candidates = frozenset([tuple([frozenset(d) for d in dists]) for dists in rowdists if all(dists)])
+        classes.setdefault(candidates, []).append(r)
+    keys = list(classes)
+
+    owners = {}
+    for c, classcands in enumerate(keys):
+        for cand in classcands:
+            owners.setdefault(cand, []).append(c)
+    candidates = list(owners)
+
+    ncols = len(candidates[0]) if candidates else 0
+    variety = [len(set([dist for cand in candidates for dist in cand[d]])) for d in range(ncols)]
+    keycols = []
+    nkeys = [1 for cand in candidates]
+    for d in sorted(range(ncols), key=lambda d: -variety[d]):
+        grown = [n * len(cand[d]) for n, cand in zip(nkeys, candidates)]
+        if variety[d] > 1 and max(grown) <= MAX_INDEX_KEYS:
+            keycols.append(d)
+            nkeys = grown
+
+    postings = {}
+    for i, cand in enumerate(candidates):
+        for key in product(*[cand[d] for d in keycols]):
+            postings.setdefault(key, []).append(i)
+
+    #the classes whose candidates match candidate i, including its own
+    matching = []
+    for i, cand in enumerate(candidates):
+        seen = set()
+        matched = set()
+        for key in product(*[cand[d] for d in keycols]):
+            for other in postings[key]:
+                if other in seen:
+                    continue
+                seen.add(other)
+                if all([not a.isdisjoint(b) for a, b in zip(cand, candidates[other])]):
+                    matched.update(owners[candidates[other]])
+        matching.append(matched)
+
+    index = {cand: i for i, cand in enumerate(candidates)}
+    counts = [1 for c in range(len(setdists))]
+    for classcands, rows in classes.items():
+        matched = set()
+        for cand in classcands:
+            matched |= matching[index[cand]]
+        if matched:
+            #matched includes the row's own class
+            confusable = sum([len(classes[keys[o]]) for o in matched])
+            for r in rows:
+                counts[r] = confusable
+
+    return(counts)
+
+
+##Counts of confusable rows for one MC set, by the method of CalculateEntropy
+def EntropyCounts(mcset, plat, method):
+    setdists = GetSetDists(mcset, plat)
+
+    if method == "pairwise":
+        return CountConfusableRows_Pairwise(setdists)
+    return CountConfusableRows(setdists)
+
+
+##Column mcset_ix of the matrix holds the entropy values of the mcset_ix-th MC set in the order mcsets iterates
+##method "indexed" counts confusable rows with CountConfusableRows and "pairwise" by comparing every pair of rows;
+##both give the same matrix
+##workers > 1 computes the MC sets in that many processes (see BuildEntropyMatrix); if timings is a list, the seconds
+##each MC set took are appended to it in column order
+def CalculateEntropy(mcsets, plat, method="indexed", workers=1, timings=None):
+    return BuildEntropyMatrix(list(mcsets), plat, len(plat), method, False, workers, timings)
+
+
+##Fills the row of the memory-mapped matrix of shared for the mcset_ix-th MC set and returns the seconds it took,
+##the process id, the statistics of the process's alignment cache and the searches and theme closures it ran
+def _EntropyForSet(shared, mcset_ix):
+    path, shape, mcsets, data, method, deidentified = shared
+    start = time.perf_counter()
+    searches, closures = SnapshotSearchCounters(), dict(closure_stats)
+
+    mcset = mcsets[mcset_ix]
+    if deidentified:
+        counts = DeidentifiedCounts(mcset, data[mcset], method)
+    else:
+        counts = EntropyCounts(mcset, data, method)
+
+    values = numpy.memmap(path, dtype=numpy.float64, mode="r+", shape=shape)
+    values[mcset_ix] = [math.log(c, 2) for c in counts]
+    values.flush()
+
+    return time.perf_counter() - start, os.getpid(), cache.stats(), SearchCountersSince(searches), ClosureStatsSince(closures)
+
+
+##Matrix of entropy values with a row for each of nrows plat rows and a column for each MC set, in the order of mcsets
+##data is the plat, or for deidentified the dictionary of deidentified distinguishers by MC set
+##The MC sets are spread over workers processes with ParallelRows.MapRows, and each one writes its values straight
+##into a matrix memory-mapped from a temporary file, stored one MC set per row so that every MC set writes one
+##contiguous block; it is copied out transposed once all are done. Every MC set is computed the same way whatever the
+##number of workers, so the matrix does not depend on it. The alignment cache statistics of every process are merged
+##and printed at the end, and the workers' searches and theme closures are added to this process's counters
+def BuildEntropyMatrix(mcsets, data, nrows, method, deidentified, workers=1, timings=None):
+    shape = (len(mcsets), nrows)
+    if not mcsets or not nrows:
+        return numpy.zeros((nrows, len(mcsets)))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "entropymatrix")
+        numpy.memmap(path, dtype=numpy.float64, mode="w+", shape=shape).flush()
+
+        shared = (path, shape, mcsets, data, method, deidentified)
+        seconds = []
+        cache_stats = {}
+        for mcset_ix, (elapsed, pid, stats, searches, closures) in MapRows(_EntropyForSet, shared, range(len(mcsets)), workers):
+            seconds.append(elapsed)
+            cache_stats[pid] = stats
+            if pid != os.getpid():
+                AddSearchCounters(searches)
+                AddClosureStats(closures)
+
+        values = numpy.memmap(path, dtype=numpy.float64, mode="r", shape=shape)
+        matrix = numpy.ascontiguousarray(values.T)
+        del values
+
+    print("Alignment cache:", FormatCacheStats(MergeCacheStats(cache_stats.values())))
+    if timings is not None:
+        timings.extend(seconds)
+
+    return(matrix)
+
+
+##Prints the n MC sets that took longest in CalculateEntropy or CalculateEntropy_Deidentified, with their seconds,
+##to spot pathological sets; Pipeline.py prints them for both matrices too
+def PrintSlowestSets(mcsets, timings, n=5):
+    slowest = sorted(range(len(timings)), key=lambda ix: -timings[ix])[:n]
+    for ix in slowest:
+        print("  %.3fs  set %d: %s" % (timings[ix], ix, sorted(mcsets[ix])))
+
+
+##Turns the (mcset, row, distinguishers) triples written by ExtractDeidentifiedDists.py into a dictionary
+##mapping each MC set to the list of its rows' deidentified distinguishers, as CalculateEntropy_Deidentified expects
+def GroupDistsBySet(dists):
+    grouped = {}
+    for mcset, r, e in dists:
+        rowdists = grouped.setdefault(mcset, [])
+        while len(rowdists) <= r:
+            rowdists.append(None)
+        rowdists[r] = e
+
+    return(grouped)
+
+
+##For the deidentified distinguishers of every row on one MC set, returns for every row 1 + the number of other rows
+##whose distinguishers can be matched with its own on all columns, running aStar_match on every pair of rows
+def CountMatchingRows_aStar(setdists, ncols):
+    counts = [1 for c in range(len(setdists))]
+        
+    for i,j in ((i,j) for i in range(len(setdists)-1) for j in range(i+1, len(setdists))):
+        match = True
+            
+        mx = MaxMatchNode(0, [setdists[i], setdists[j]], [0 for x in range(ncols)])
+        match_result = aStar_match(mx, verbose=0)
+        matchcols = extractMatch(match_result)
+            
+        if len(matchcols)!=ncols:
+            match = False
+                
+        if match==True:
+            counts[i]+=1
+            counts[j]+=1  
+
+    return(counts)
+
+
+##Same counts as CountMatchingRows_aStar, deciding each pair of rows with fullMatch instead of a search
+def CountMatchingRows_Pairwise(setdists):
+    counts = [1 for c in range(len(setdists))]
+
+    for i,j in ((i,j) for i in range(len(setdists)-1) for j in range(i+1, len(setdists))):
+        if fullMatch(setdists[i], setdists[j]):
+            counts[i]+=1
+            counts[j]+=1
+
+    return(counts)
+
+
+##Same counts as CountMatchingRows_aStar, from canonical signatures instead of pairwise searches
+##Rows with the same column lengths and signature all match each other, so a group of n such rows adds n-1 to each
+##of its rows. Groups with different column lengths can still match on the shorter lengths (as aStar_match compares
+##them); that is decided once per pair of groups with fullMatch on one row of each
+def CountMatchingRows(setdists):
+    groups = {}
+    for r, rowdists in enumerate(setdists):
+        lengths = tuple([len(col) for col in rowdists])
+        groups.setdefault((lengths, canonicalSignature(rowdists)), []).append(r)
+
+    counts = [1 for c in range(len(setdists))]
+    keys = list(groups)
+
+    for g, (lengths1, sig1) in enumerate(keys):
+        group1 = groups[(lengths1, sig1)]
+        row1 = setdists[group1[0]]
+        for r in group1:
+            counts[r] += len(group1) - 1
+
+        for lengths2, sig2 in keys[g+1:]:
+            if lengths1 == lengths2:
+                continue
+            group2 = groups[(lengths2, sig2)]
+            if fullMatch(row1, setdists[group2[0]]):
+                for r in group1:
+                    counts[r] += len(group2)
+                for r in group2:
+                    counts[r] += len(group1)
+
+    return(counts)
+
+
+##Counts of matching rows for one MC set from the deidentified distinguishers of its rows, by the method of
+##CalculateEntropy_Deidentified
+def DeidentifiedCounts(mcset, setdists, method):
+    if method == "astar":
+        return CountMatchingRows_aStar(setdists, len(mcset))
+    elif method == "pairwise":
+        return CountMatchingRows_Pairwise(setdists)
+    return CountMatchingRows(setdists)
+
+
+##method "signature" counts matching rows by canonical signatures, "pairwise" by calling fullMatch on every pair of rows
+##and "astar" by running aStar_match on every pair of rows; all three give the same matrix
+##workers and timings as for CalculateEntropy
+def CalculateEntropy_Deidentified(plat, dists, method="signature", workers=1, timings=None):
+    return BuildEntropyMatrix(list(dists), dists, len(plat), method, True, workers, timings)
+
+
+##User must provide plat as a .csv file, and the mcsets and deidentified distinguishers written by the earlier scripts
+##(older .dump files are read as well)
+##Optional: --workers N computes the MC sets of each matrix in N processes, --slowest K prints the K MC sets that took
+##longest for each matrix (default 5)
+##--verify also computes the matrix by comparing every pair of rows and the deidentified matrix with pairwise
+##aStar_match, and checks that they are identical to the fast ones
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("plat")
+    parser.add_argument("mcsets")
+    parser.add_argument("dists")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--slowest", type=int, default=5)
+    parser.add_argument("--verify", action="store_true")
+    args = parser.parse_args()
+
+    mcsets = sorted(LoadMCSets(args.mcsets), key=sorted)
+    dists = LoadDeidentifiedDists(args.dists)
+    if not isinstance(dists, dict):
+        dists = GroupDistsBySet(dists)
+
+    with open(args.plat, encoding="utf8") as csvfile:
+        csvreader = csv.reader(csvfile, delimiter=',')
+        next(csvreader, None)
+        plat = list(csvreader)
+        rowlabels = [row[0] for row in plat]
+           
+        #for normal mcsets 
+        timings = []
+        matrix1 = CalculateEntropy(mcsets, plat, workers=args.workers, timings=timings)
+        SaveEntropyMatrix("entropymatrix", matrix1, rowlabels, mcsets)
+        print("Slowest MC sets:")
+        PrintSlowestSets(mcsets, timings, args.slowest)
+        
+        #for deidentified mcsets
+        start = time.time()
+        timings = []
+        matrix2 = CalculateEntropy_Deidentified(plat, dists, workers=args.workers, timings=timings)
+        print("Deidentified entropy by signatures: %.1fs" % (time.time() - start))
+        SaveEntropyMatrix("entropymatrix_deidentified", matrix2, rowlabels, list(dists))
+        print("Slowest deidentified MC sets:")
+        PrintSlowestSets(list(dists), timings, args.slowest)
+
+        if args.verify:
+            check = CalculateEntropy(mcsets, plat, method="pairwise", workers=args.workers)
+            print("Matrices identical (comparing every pair of rows):", numpy.array_equal(matrix1, check))
+
+            start = time.time()
+            check = CalculateEntropy_Deidentified(plat, dists, method="astar", workers=args.workers)
+            print("Deidentified entropy by pairwise aStar_match: %.1fs" % (time.time() - start))
+            print("Matrices identical:", numpy.array_equal(matrix2, check))
+
+        print("Alignment cache:", cache)
+        print("Theme closure:", closure_stats)
@@ -1,83 +1,64 @@
-import pickle
-import csv
-import random
-import sys
-
-from MaximallyConfusableSubsets_Deidentified import *
-from approximateMultialign import *
-from itertools import combinations
-
-##Given a set of forms, returns all possible themes for that set
-def ExtractThemesforSet(s):
-    pairwisethemes = set()
-    for i in range(len(s)-1):
-        for j in range(i+1, len(s)):
-            pthemes = GetPairwiseThemes(s[i], s[j])
-            for p in pthemes:
-                pairwisethemes.add(p)
-                
-    possiblethemes = set()
-    newthemes = pairwisethemes
-    while newthemes:
-        usefulpairs = combinations(newthemes, 2)
-        possiblethemes.update(newthemes)
-        newthemes = set()
-        for a, b in usefulpairs:
-            pairthemes = GetPairwiseThemes(a, b)
-            for t in pairthemes:
-                if t not in possiblethemes:
-                    newthemes.add(t)
-    
-    themes = set()
-    for p in possiblethemes:
-        flag = False
-        for form in s:
-            if CheckThemeValidity(p, form)==False:
-                flag = True
-        
-        if flag==False:
-            themes.add(p)
-    
-    return(themes)
-
-
-def GetDists(mcsets, rows):
-    mcsets_list = list(mcsets)
-    
-    for m in range(len(mcsets)):
-        for r in range(len(rows)):
-            forms = []
-            dists = []
-            for col_ix in mcsets_list[m]:
-                forms.append(rows[r][col_ix])
-                            
-            theme_options = ExtractThemesforSet(forms)
-            theme = ''.join(random.sample(theme_options, 1))
-            
-            for f in forms:
-                d = GetDistinguishers(theme, f)
-                dists.append(''.join(random.sample(d, 1)))
-            
-            e = approximateMultialign(dists)
-            
-            yield(mcsets_list[m],r,e)
-            
-    
-
-#User must provide plat as a .csv file and deidentified mcsets as a .dump file
-if __name__ == "__main__":
-    file = sys.argv[1]
-
-    with open(file, encoding="utf8") as csvfile:
-        csvreader = csv.reader(csvfile, delimiter=',')
-        next(csvreader, None)
-        rows = list(csvreader)
-        
-        mcsets = pickle.load(open(sys.argv[2], "rb"))
-        dists = GetDists(mcsets, rows)
-        
-        #print(list(dists))   
-        pickle.dump(list(dists), open("deidentified_dists.dump", "wb"))
-                
-        
-        
+import argparse
+import csv
+import random
+
+from MaximallyConfusableSubsets_Deidentified import *
+from approximateMultialign import *
+from SearchCore import search_counters
+from Artifacts import LoadMCSets, SaveDeidentifiedDists
+
+##For every deidentified MC set and every row, yields the set, the row index and the row's deidentified distinguishers
+##rnd picks a theme and a distinguisher where there are several; sets are visited in sorted order so a seeded rnd gives reproducible output
+##budget is the (expansions, seconds) budget of each multialignment (see approximateMultialign), (None, None) for none
+def GetDists(mcsets, rows, rnd=random, budget=(None, None)):
+    mcsets_list = sorted(mcsets, key=sorted)
+    
+    for m in range(len(mcsets)):
+        for r in range(len(rows)):
+            forms = []
+            dists = []
+            for col_ix in mcsets_list[m]:
+                forms.append(rows[r][col_ix])
+                            
+            theme_options = ExtractThemesforSet(forms)
+            theme = rnd.choice(sorted(theme_options))
+            
+            for f in forms:
+                d = GetDistinguishers(theme, f)
+                dists.append(rnd.choice(sorted(d)))
+            
+            e, gap = approximateMultialign(dists, *budget)
+            
+            yield(mcsets_list[m],r,e)
+            
+    
+
+#User must provide plat as a .csv file and the deidentified mcsets written by MaximallyConfusableSubsets_Deidentified.py
+#Optional: --seed S for the random choice among themes and distinguishers, --expansions N and/or --seconds S to bound
+#each multialignment (default: no bound)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("plat")
+    parser.add_argument("mcsets")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--expansions", type=int)
+    parser.add_argument("--seconds", type=float)
+    args = parser.parse_args()
+
+    with open(args.plat, encoding="utf8") as csvfile:
+        csvreader = csv.reader(csvfile, delimiter=',')
+        next(csvreader, None)
+        rows = list(csvreader)
+        
+        mcsets = LoadMCSets(args.mcsets)
+        dists = GetDists(mcsets, rows, random.Random(args.seed), (args.expansions, args.seconds))
+        
+        #print(list(dists))   
+        SaveDeidentifiedDists("deidentified_dists", dists)
+        print("Alignment cache:", cache)
+        print("Multialignment cache:", multialign_cache)
+        print("Theme closure:", closure_stats)
+        print("Searches:", search_counters)
+                
+        
+        
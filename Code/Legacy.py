@@ -0,0 +1,306 @@
+from heapq import heappush, heappop
+from itertools import permutations
+
+from multialign import aStar
+
+#The original implementations of code that has since been replaced, kept only as baselines for Benchmarks.py
+#Each keeps its original name and behaviour; the pipeline does not use any of them
+
+###############################################################################
+#EditDistanceWithAlignment.py: the recursive alignment, replaced by the DAG engine
+
+alignment_cache = {}
+
+##Returns minimum edit distance and all possible alignments for a pair of forms
+def EditDistanceWithAlignment(s1, s2):
+    if(len(s1)==0):
+        return len(s2), set([(tuple(), tuple([(char, False) for char in s2]))])
+    if(len(s2)==0):
+        return len(s1), set([(tuple([(char, False) for char in s1]), tuple())])
+    if(s1, s2) in alignment_cache:
+        return alignment_cache[(s1, s2)]
+
+    if(s1[-1]==s2[-1]):
+        cost = 0
+    else:
+        cost = 2
+
+    op1, solutions1 = EditDistanceWithAlignment(s1[:-1], s2)
+    op2, solutions2 = EditDistanceWithAlignment(s1, s2[:-1])
+    op3, solutions3 = EditDistanceWithAlignment(s1[:-1], s2[:-1])
+
+    op1 += 1
+    op2 += 1
+    op3 += cost
+
+    solutions = set()
+    mincost = min(op1, op2, op3)
+
+    if op1==mincost:
+        for (sol1, sol2) in solutions1:
+            solutions.add( (sol1 + ((s1[-1], False),), sol2) )
+    if op2==mincost:
+        for (sol1, sol2) in solutions2:
+            solutions.add( (sol1, sol2 + ((s2[-1], False),)) )
+    if op3==mincost and cost==0:
+        for (sol1, sol2) in solutions3:
+            solutions.add( (sol1 + ((s1[-1], True),), sol2 + ((s2[-1], True),)) )
+    if op3==mincost and cost>0:
+        for (sol1, sol2) in solutions3:
+            solutions.add( (sol1 + ((s1[-1], False),), sol2 + ((s2[-1], False),)) )
+    alignment_cache[(s1, s2)] = (mincost, solutions)
+
+    return mincost, solutions
+
+
+###############################################################################
+#MaximallyConfusableSubsets.py: the permutations-based maximality filter of CompareTwoRows, replaced by
+#ColumnSets.MaximalSets
+
+##Returns the column sets of comps that are not a subset of another one
+def MaximalFilter(comps):
+    mcsets = []
+    for comp in comps:
+        if comp and comp not in mcsets:
+            mcsets.append(comp)
+    for a, b in permutations(mcsets, 2):
+        if a.issubset(b) == True and a in mcsets:
+            mcsets.remove(a)
+    return mcsets
+
+
+###############################################################################
+#aStar_matching.py: the search node and queue, replaced by the compact node and SearchCore.py
+
+class MaxMatchNode:
+    def __init__(self, value, data, probvars, assnmts={}):
+        self.value = value
+        self.data = data
+        self.probvars = probvars
+        self.assnmts = assnmts
+        self.hVal = None
+
+    def complete(self):
+        for p in self.probvars:
+            if p == 0:
+                return False
+        return True
+
+    def key(self):
+        return tuple(self.probvars)
+
+    def priority(self):
+        return self.value + self.heuristic()
+
+    def __eq__(self, other):
+        return self.key() == other.key()
+
+    def __lt__(self, other):
+        return (self.priority() < other.priority())
+
+    def heuristic(self):
+        if self.hVal is None:
+            self.hVal = -self.probvars.count(0)
+        return self.hVal
+
+    def successors(self):
+        res = []
+        newcol = self.probvars.index(0)
+        s0 = self.probvars[:]
+        s0[newcol] = -1
+        newassnmts = dict(self.assnmts.items())
+        res.append(MaxMatchNode(self.value, self.data, s0, newassnmts))
+
+        newassnmts = dict(self.assnmts.items())
+        assignedBs = set(newassnmts.values())
+        s1 = self.probvars[:]
+        s1[newcol] = 1
+        for ci, cj in zip(self.data[0][newcol], self.data[1][newcol]):
+            ciVal = newassnmts.get(ci, None)
+            if ciVal is None and cj not in assignedBs:
+                newassnmts[ci] = cj
+                assignedBs.add(cj)
+            elif ciVal != cj:
+                return res
+
+        for col, current in enumerate(s1):
+            if current == 0:
+                matched = 1
+                for ci, cj in zip(self.data[0][col], self.data[1][col]):
+                    ciVal = newassnmts.get(ci, None)
+                    if ciVal is None and cj not in assignedBs:
+                        matched = 0
+                        break
+                    elif ciVal != cj:
+                        matched = -1
+                        break
+                s1[col] = matched
+
+        res.append(MaxMatchNode(-s1.count(1), self.data, s1, newassnmts))
+        return res
+
+
+class PriorityQueue:
+    def __init__(self):
+        self.heap = []
+        self.entries = {}
+
+    def add(self, entry):
+        if entry.key() in self.entries:
+            self.remove(entry)
+        self.entries[entry.key()] = entry
+        entry.valid = True
+        heappush(self.heap, entry)
+
+    def remove(self, entry):
+        current = self.entries.get(entry.key())
+        if current is not None:
+            current.valid = False
+            del self.entries[entry.key()]
+
+    def update(self, entry):
+        current = self.entries.get(entry.key())
+        if current and (entry.priority() < current.priority()):
+            self.remove(entry)
+            self.add(entry)
+        elif not current:
+            self.add(entry)
+
+    def popMin(self):
+        while self.heap:
+            nxt = heappop(self.heap)
+            if nxt.valid:
+                self.remove(nxt)
+                return nxt
+
+
+###############################################################################
+#maxunifiedmatching.py: the ILP before its presolve
+
+def maxUnifiedMatching(rowA, rowB, solver=None):
+    import pulp
+
+    asyms = set()
+    for col in rowA:
+        asyms.update(col)
+    bsyms = set()
+    for col in rowB:
+        bsyms.update(col)
+
+    ms = [pulp.LpVariable("m_%d" % col, 0, 1, "Binary") for col in range(len(rowA))]
+    syms = {}
+    for sa in asyms:
+        for sb in bsyms:
+            syms[sa, sb] = pulp.LpVariable("x_%d_%d" % (sa, sb), 0, 1, "Binary")
+
+    problem = pulp.LpProblem("maxmatch", pulp.LpMaximize)
+    problem += sum(ms)
+    for col, (cA, cB) in enumerate(zip(rowA, rowB)):
+        if len(cA) != len(cB):
+            problem.add(ms[col] == 0)
+        else:
+            for sA, sB in zip(cA, cB):
+                problem.add(ms[col] <= syms[sA, sB])
+    for sa in asyms:
+        problem.add(sum([syms[sa, sb] for sb in bsyms]) <= 1)
+    for sb in bsyms:
+        problem.add(sum([syms[sa, sb] for sa in asyms]) <= 1)
+
+    problem.solve(solver)
+    assert pulp.LpStatus[problem.status] == "Optimal"
+    return [ii for ii, mi in enumerate(ms) if mi.varValue > 0]
+
+
+###############################################################################
+#approximateMultialign.py: the incremental merge, replaced by IncrementalAlignment
+
+class ExtendAlignNode:
+    def __init__(self, cost, ptr, layer, solution, string, charAtLayer):
+        self.cost = cost
+        self.ptr = ptr
+        self.layer = layer
+        self.solution = solution
+        self.string = string
+        self.charAtLayer = charAtLayer
+        self.heuristic = self.computeHeuristic()
+
+    def successors(self):
+        res = []
+        nextChar = self.string[self.ptr]
+        nextSym = self.layer - 1
+        for layer in range(nextSym, 0, -1):
+            charAtLayer = self.charAtLayer[layer]
+            if charAtLayer == nextChar:
+                newSol = self.solution[:] + [layer]
+                res.append(ExtendAlignNode(self.cost, self.ptr + 1, layer, newSol, self.string, self.charAtLayer))
+
+        newSol = self.solution[:] + ["NSYM"]
+        res.append(ExtendAlignNode(self.cost + 1, self.ptr + 1, self.layer, newSol, self.string, self.charAtLayer))
+        return res
+
+    def complete(self):
+        return self.ptr == len(self.string)
+
+    def key(self):
+        return self.ptr, tuple(self.solution)
+
+    def priority(self):
+        return self.cost + self.heuristic, self.heuristic
+
+    def __eq__(self, other):
+        return self.key() == other.key()
+
+    def __lt__(self, other):
+        return (self.priority() < other.priority())
+
+    def computeHeuristic(self):
+        ownBag = {}
+        for ch in self.string[self.ptr:]:
+            ownBag[ch] = ownBag.get(ch, 0) + 1
+
+        otherBag = {}
+        for layer, ch in self.charAtLayer.items():
+            if layer < self.layer:
+                otherBag[ch] = otherBag.get(ch, 0) + 1
+
+        res = 0
+        for ch, ct in ownBag.items():
+            if ct > 0:
+                res += ct
+        return res
+
+
+def incrementAll(extracted, sym):
+    for item in extracted:
+        for ii in range(len(item)):
+            if item[ii] >= sym:
+                item[ii] += 1
+
+
+def renumber(extracted, draftAssignments):
+    for ii, sym in enumerate(draftAssignments):
+        if sym == "NSYM":
+            if ii == 0:
+                prevSym = max([max(xx) for xx in extracted if len(xx)]) + 1
+            else:
+                prevSym = draftAssignments[ii - 1]
+
+            incrementAll(extracted, prevSym)
+            for jj in range(ii):
+                draftAssignments[jj] += 1
+            draftAssignments[ii] = prevSym
+
+    return draftAssignments
+
+
+def incrementalMerge(string, ind, strs, extracted):
+    charAtLayer = {}
+    for si, sol in zip(strs, extracted):
+        for ch, layer in zip(si, sol):
+            charAtLayer[layer] = ch
+
+    best = aStar(ExtendAlignNode(0, 0, max(charAtLayer.keys()) + 1, [], string, charAtLayer), verbose=0)
+    solution = best.solution
+    if "NSYM" in solution:
+        solution = renumber(extracted, solution)
+    extracted.append(solution)
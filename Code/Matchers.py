@@ -0,0 +1,99 @@
+import pulp
+
+from ColumnSets import PopCount
+from aStar_matching import MatchProblem, MaxMatchNode, aStar_match, extractMatch
+from maxunifiedmatching import maxUnifiedMatching
+
+#Backends for the maximum unified matching problem: given the deidentified distinguishers of two rows
+#(one list of ints per column), find a largest set of columns that one one-to-one mapping of symbols
+#matches. Every backend takes the two rows and returns the matched columns as a sorted list of indices.
+#As in aStar_match, a pair of columns is compared up to the length of the shorter one.
+#
+#All backends find matches of the same size; where several largest matches exist they may pick
+#different ones. "auto" picks a backend from the size of the problem (see ChooseMatcher).
+#Benchmarks.py matchers compares them on matching problems taken from the plat.
+
+##A* search over the columns of aStar_matching.py
+def MatchAStar(rowA, rowB):
+    return extractMatch(aStar_match(MaxMatchNode(0, [rowA, rowB], [0 for x in range(len(rowA))]), verbose=0))
+
+
+##Integer linear program of maxunifiedmatching.py, solved quietly by pulp's bundled CBC solver
+def MatchILP(rowA, rowB):
+    if not rowA:
+        return []
+
+    #the program rejects columns of different lengths, so cut each pair to the shorter one first
+    rowA, rowB = zip(*[(colA[:len(colB)], colB[:len(colA)]) for colA, colB in zip(rowA, rowB)])
+    return maxUnifiedMatching(list(rowA), list(rowB), solver=pulp.PULP_CBC_CMD(msg=False))
+
+
+##Exact branch and bound over the column conflict graph
+##Columns that are pairwise consistent are consistent together (see MatchProblem.findConflicts), so a largest match
+##is a largest set of matchable columns with no conflict between them. Columns are decided most constrained first,
+##columns that conflict with no remaining candidate join without branching, and a branch is cut when its columns
+##plus the clique-cover bound of its candidates cannot beat the best match found so far.
+def MatchBranchAndBound(rowA, rowB):
+    problem = MatchProblem([rowA, rowB], len(rowA), bound="cliques", order="constrained")
+    conflicts = problem.conflicts
+    best = [0, 0] #columns and size of the best match so far
+
+    def Expand(chosen, size, candidates):
+        free = 0
+        rest = candidates
+        while rest:
+            bit = rest & -rest
+            rest ^= bit
+            if not conflicts[bit.bit_length() - 1] & candidates:
+                free |= bit
+        chosen |= free
+        size += PopCount(free)
+        candidates &= ~free
+
+        if not candidates:
+            if size > best[1]:
+                best[:] = [chosen, size]
+            return
+        if size + problem.upperBound(candidates) <= best[1]:
+            return
+
+        bit = problem.nextColumn(candidates)
+        Expand(chosen | bit, size + 1, candidates & ~bit & ~conflicts[bit.bit_length() - 1])
+        Expand(chosen, size, candidates & ~bit)
+
+    Expand(0, 0, ((1 << len(rowA)) - 1) & ~problem.unmatchable)
+    return [col for col in range(len(rowA)) if best[0] >> col & 1]
+
+
+matchers = {
+    "astar": MatchAStar,
+    "ilp": MatchILP,
+    "bnb": MatchBranchAndBound,
+}
+
+
+##Number of distinct symbols in the larger alphabet of the two rows
+def AlphabetSize(rowA, rowB):
+    return max(len(set([sym for col in row for sym in col])) for row in (rowA, rowB))
+
+
+##Name of the backend that "auto" uses for matching rowA with rowB
+##From Benchmarks.py matchers on the problems of a deidentified run on the Spanish plat (1 to 60 columns, alphabets of
+##5 to 27 symbols): branch and bound is the fastest up to 4 columns and from 17 on, while from 9 to 16 columns the ILP
+##is, as its presolve splits those problems into groups small enough to search without starting the solver. From 5 to
+##8 columns the two were within 5% of each other (0.119 against 0.125 ms a match, the ILP ahead), so the ILP is
+##picked from 8 columns; where it starts within that tie makes no measurable difference. On random problems of 128 columns and
+##more the clique cover bound no longer cuts enough and the ILP is faster again. Since the ILP only builds variables
+##for symbol pairs that occur together, the alphabet size made no difference once the problem was presolved.
+def ChooseMatcher(rowA, rowB):
+    if 8 <= len(rowA) <= 16 or len(rowA) >= 128:
+        return "ilp"
+    return "bnb"
+
+
+##Returns the columns of a largest match between rowA and rowB as a sorted list of indices
+##matcher names a backend of matchers, or is "auto" to let ChooseMatcher pick one
+def MaxMatch(rowA, rowB, matcher="astar"):
+    if matcher == "auto":
+        matcher = ChooseMatcher(rowA, rowB)
+    return matchers[matcher](rowA, rowB)
@@ -1,309 +1,221 @@
-import csv
-import sys
-from itertools import combinations, permutations
-import pickle
-from approximateMultialign import *
-from maxunifiedmatching import *
-from aStar_matching import *
-import random
-
-#Goal: identify maximally confusable subsets of the plat
-
-cache = {}
-
-##Returns minimum edit distance and all possible alignments for a pair of forms
-def EditDistanceWithAlignment(s1, s2, level=0):
-    if(len(s1)==0):
-        return len(s2), set([
-            (tuple(), tuple([(char, False) for char in s2]))
-            ])
-    if(len(s2)==0):
-        return len(s1), set([
-            (tuple([(char, False) for char in s1]), tuple())    
-            ])
-    if(s1, s2) in cache:
-        return cache[(s1, s2)]
-  
-    if(s1[-1]==s2[-1]):
-        cost = 0
-    else:
-        cost = 2
-
-    op1, solutions1 = EditDistanceWithAlignment(s1[:-1], s2, level=level + 1)
-    op2, solutions2 = EditDistanceWithAlignment(s1, s2[:-1], level=level + 1)
-    op3, solutions3 = EditDistanceWithAlignment(s1[:-1], s2[:-1], level=level + 1)
-
-    op1 += 1
-    op2 += 1
-    op3 += cost
-
-    solutions = set()
-    mincost = min(op1, op2, op3)
-
-    if op1==mincost:
-        for (sol1, sol2) in solutions1:
-            solutions.add( (sol1 + ((s1[-1], False),), sol2) )
-    if op2==mincost:
-        for (sol1, sol2) in solutions2:
-            solutions.add( (sol1, sol2 + ((s2[-1], False),)) )
-    if op3==mincost and cost==0:
-        for (sol1, sol2) in solutions3:
-            solutions.add( (sol1 + ((s1[-1], True),), sol2 + ((s2[-1], True),)) )
-    if op3==mincost and cost>0:
-        for (sol1, sol2) in solutions3:
-            solutions.add( (sol1 + ((s1[-1], False),), sol2 + ((s2[-1], False),)) )
-    cache[(s1, s2)] = (mincost, solutions)
-    
-    return mincost, solutions
-
-
-##Extracts theme from two given alignments
-def Theme(alignment1, alignment2):
-    theme = []
-    for (char, alt) in alignment1:
-        if alt:
-            theme.append(char)
-    return theme
-
-
-##Returns list of all possible themes for a pair of forms
-def GetPairwiseThemes(form1, form2):
-    mincost, solutions = EditDistanceWithAlignment(form1, form2)
-    
-    themes = []
-    for ix, sol in enumerate(solutions):
-        alignments = []
-        for ix2, al in enumerate(sol):
-            alignments.append(al)
-        theme = "".join(Theme(alignments[0], alignments[1]))    
-        themes.append(theme)
-    
-    #if len(themes)>3:
-        #print("Warning:", form1, "and", form2, "have", len(themes), "pairwise themes")
-    
-    return(themes)
-    
-
-##Returns list of all possible themes for a row (microclass)
-def ExtractThemesforRow(row):
-    pairwisethemes = set()
-    for i in range(1, len(row)-1):
-        for j in range(i+1, len(row)):
-            pthemes = GetPairwiseThemes(row[i], row[j])
-            for p in pthemes:
-                pairwisethemes.add(p)
-                
-    themes = set()
-    newthemes = pairwisethemes
-    while newthemes:
-        usefulpairs = combinations(newthemes, 2)
-        themes.update(newthemes)
-        newthemes = set()
-        for a, b in usefulpairs:
-            pairthemes = GetPairwiseThemes(a, b)
-            for t in pairthemes:
-                if t not in themes:
-                    newthemes.add(t)
-    
-    return(themes)
-    
-    
-    
-##Returns boolean value indicating whether a given theme is valid for a particular form
-def CheckThemeValidity(theme, form):
-    check = GetPairwiseThemes(theme, form)    
-    valid = True
-    
-    for i in range(len(check)):
-        if check[i]!=theme:
-            valid = False
-
-    return(valid)
-
-
-##Given a theme and a form, returns the corresponding distinguisher in string format
-def GetDistinguishers(theme, form):
-    mincost, solutions = EditDistanceWithAlignment(theme, form)
-    alignments = []
-    distinguishers = set()
-            
-    for ix, sol in enumerate(solutions):
-        for ix2, al in enumerate(sol):
-            alignments.append(al)
-        
-    if CheckThemeValidity(theme, form)==False:
-        print("Error:", theme, "is not a theme for", form)        
-    else:
-        for i in range(1, len(alignments), 2):
-            dist = []
-            for (char, alt) in alignments[i]:
-                if alt==False:
-                    dist.append(char)
-            distinguishers.add("".join(dist))
-        
-        return(distinguishers)
-        
-        
-##Given a distinguisher and a form, returns the corresponding theme in string format
-def GetThemes(dist, form):
-    mincost, solutions = EditDistanceWithAlignment(dist, form)
-    alignments = []
-    themes = set()
-    
-    for ix, sol in enumerate(solutions):
-        for ix2, al in enumerate(sol):
-            alignments.append(al)
-            
-    for i in range(1, len(alignments), 2):
-        theme = []
-        for (char, alt) in alignments[i]:
-            if alt==False:
-                theme.append(char)
-        themes.add("".join(theme))
-        
-    return(themes)
-    
-
-##Returns the largest possible subset of forms for every theme for every row of the plat as a list of dictionaries
-def GetLargestSetsbyTheme(rows):
-    themes_byrow = []
-    subsets_bytheme = []
-
-    for row in rows:
-        themes_byrow.append(list(ExtractThemesforRow(row)))
-        
-    for r in range(len(themes_byrow)):
-        rowsets = {}
-        for theme in themes_byrow[r]:
-            themeset = []
-            for formidx in range(1, len(rows[r])):
-                form = rows[r][formidx]
-                if(CheckThemeValidity(theme, form)==True):
-                    themeset.append(formidx)
-            rowsets[theme]=themeset
-        subsets_bytheme.append(rowsets)
-            
-    return(subsets_bytheme)      
-    
-    
-
-def CompareTwoSets_Deidentified(row1, row2, theme1, subset1, theme2, subset2):
-    cols = set()
-    inter = set(subset1).intersection(subset2)
-    dists1 = []
-    dists2 = []
-    col_keys = []
-    deid_dists1 = []
-    deid_dists2 = []
-    
-    #get distinguisher sets for both rows; randomly select a distinguisher if multiple options for a form
-    for val in inter:
-        d1 = GetDistinguishers(theme1, row1[val])
-        d2 = GetDistinguishers(theme2, row2[val])
-        dists1.append(''.join(random.sample(d1, 1)))
-        dists2.append(''.join(random.sample(d2, 1)))
-
-    e1 = approximateMultialign(dists1)
-    e2 = approximateMultialign(dists2)
-    
-    #match column id numbers with deidentified distinguishers
-    for ix in range(len(inter)):
-        col_keys.append(list(inter)[ix])
-        deid_dists1.append(e1[ix])
-        deid_dists2.append(e2[ix])
-        
-    #match as many columns as possible
-    mx = MaxMatchNode(0, [deid_dists1, deid_dists2], [0 for x in range(len(deid_dists1))])
-    match = aStar_match(mx, verbose=0)
-    matchcols = extractMatch(match)
-    
-    for m in matchcols:
-        cols.add(col_keys[m])
-        
-    return(cols)    
-    
-    
-    
-##For two rows, returns their maximally confusable subsets calculated according to the deidentified distinguisher sets
-def CompareTwoRows_Deidentified(row1, row2, subsets_bytheme1, subsets_bytheme2):
-    mcsets = []
-    themes1 = []  
-    themes2 = []
-    
-    #Get themes for both rows
-    for t1 in subsets_bytheme1:
-        themes1.append(t1)
-            
-    for t2 in subsets_bytheme2:
-        themes2.append(t2)
-                
-    #Compare every possible combinations of themes between the two rows
-    for i in range(len(themes1)):
-        for j in range(len(themes2)):
-            comp = CompareTwoSets_Deidentified(row1, row2, themes1[i], subsets_bytheme1[themes1[i]], themes2[j], subsets_bytheme2[themes2[j]])
-            if comp and comp not in mcsets and len(comp)>1:
-                mcsets.append(comp)
-
-    for a, b in permutations(mcsets, 2):
-        if a.issubset(b) == True and a in mcsets:
-            mcsets.remove(a)
-            
-    #print(mcsets)
-    return(mcsets)
-    
-
-##Returns all possible maximally confusable subsets (by plat column id numbers) for every row in the plat
-def FindMaximallyConfusableSubsets_Deidentified(rows):
-    subsets_bytheme = GetLargestSetsbyTheme(rows)
-    mcsets_byrow = {}
-    mcsets = set()
-
-    print("Sets by theme computed")
-    
-    for i in range(len(rows)):
-        print(i)
-        mcsets_byrow[i+1] = []
-        for j in range(i + 1, len(rows)):
-            print("\t", j)
-            pairwisesets = CompareTwoRows_Deidentified(rows[i], rows[j], subsets_bytheme[i], subsets_bytheme[j])
-            for p in range(len(pairwisesets)):
-                if pairwisesets[p] not in mcsets_byrow[i+1] and len(pairwisesets[p])>1:
-                    mcsets_byrow[i+1].append(frozenset(pairwisesets[p]))
-    
-    #print("Pairwise MC sets calculated")
-
-    mcsets = set()
-
-    for row in range(1, len(mcsets_byrow)+1):
-        newsets = set(mcsets_byrow[row])
-        while newsets:
-            usefulsets = combinations(newsets, 2)
-            mcsets.update(newsets)
-            newsets = set()
-            
-            for u in usefulsets:
-                ulist = []
-                for s in u:
-                    ulist.append(s)
-                inter = frozenset.intersection(*ulist)
-                if len(inter)>1:
-                    newsets.add(inter)
-                        
-        #print("Row", row, "calculations finished")
-
-    return(mcsets)
-
-
-##User must provide plat in csv format as input
-if __name__ == "__main__":
-    file = sys.argv[1]
-
-    with open(file, encoding="utf8") as csvfile:
-        csvreader = csv.reader(csvfile, delimiter=',')
-        next(csvreader, None)
-        rows = list(csvreader)
-        mcsets = FindMaximallyConfusableSubsets_Deidentified(rows)
-
-        print("Number of maximally confusable sets (deid):", len(mcsets))
-        print("Maximally confusable sets by column index:", mcsets)
-        pickle.dump(mcsets, open("mcsets_deidentified.dump", "wb"))
+import argparse
+import csv
+import os
+import sys
+from EditDistanceWithAlignment import *
+from ColumnSets import *
+from ParallelRows import *
+from Artifacts import SaveMCSets
+from approximateMultialign import *
+from maxunifiedmatching import *
+from aStar_matching import *
+from Matchers import MaxMatch, matchers
+from SearchCore import SnapshotSearchCounters, SearchCountersSince, AddSearchCounters
+import random
+
+#Goal: identify maximally confusable subsets of the plat
+
+##Returns list of all possible themes for a row (microclass)
+def ExtractThemesforRow(row):
+    return(ThemeClosure(row[1:]))
+    
+    
+    
+##Returns the largest possible subset of forms for every theme for every row of the plat as a list of dictionaries
+def GetLargestSetsbyTheme(rows):
+    themes_byrow = []
+    subsets_bytheme = []
+
+    #themes are sorted so that random choices made per theme are reproducible
+    for row in rows:
+        themes_byrow.append(sorted(ExtractThemesforRow(row)))
+        
+    for r in range(len(themes_byrow)):
+        rowsets = {}
+        for theme in themes_byrow[r]:
+            rowsets[theme] = GetValidForms(theme, rows[r][1:], start=1)
+        subsets_bytheme.append(rowsets)
+            
+    return(subsets_bytheme)      
+    
+    
+##Returns, for every row, a table theme -> column -> distinguisher, randomly selecting a distinguisher if multiple options for a form
+##rows are numbered from first; each row draws from its own generator seeded from (seed, row), so the choice for a
+##(row, theme, column) is the same in every row pair it takes part in and does not depend on how rows are spread over workers
+def ChooseDistinguishers(rows, subsets_bytheme, seed, first=0):
+    choices = []
+
+    for r in range(len(rows)):
+        rnd = RowRandom(seed, first + r)
+        table = {}
+        for theme in subsets_bytheme[r]:
+            coldists = {}
+            for col in subsets_bytheme[r][theme]:
+                coldists[col] = rnd.choice(sorted(GetDistinguishers(theme, rows[r][col])))
+            table[theme] = coldists
+        choices.append(table)
+
+    return(choices)
+
+
+##Returns the deidentified encoding of the distinguishers chosen for row r under theme on the columns of mask, in column order
+##The encoding only depends on (row, theme, columns), so it is computed once and then taken from encodings,
+##the cache of the current run
+##budget is the (expansions, seconds) budget of approximateMultialign, (None, None) for none
+def DeidentifiedEncoding(choices, encodings, r, theme, mask, budget=(None, None)):
+    key = (r, theme, mask)
+    e = encodings.get(key)
+    if e is None:
+        e, gap = approximateMultialign([choices[r][theme][col] for col in sorted(MaskColumns(mask))], *budget)
+        encodings.put(key, e)
+
+    return(e)
+
+
+##Returns largest set of columns (as a bitmask) whose deidentified distinguishers in row r1 given theme1 can be matched with those in row r2 given theme2
+##matcher names the backend of Matchers.py that finds the match, budget the budget of the multialignments
+def CompareTwoSets_Deidentified(choices, encodings, r1, theme1, r2, theme2, matcher="astar", budget=(None, None)):
+    cols = 0
+    inter = ColumnMask(choices[r1][theme1]) & ColumnMask(choices[r2][theme2])
+    if not inter:
+        return(cols)
+
+    #deidentified distinguishers of both rows, in column order
+    col_keys = sorted(MaskColumns(inter))
+    deid_dists1 = DeidentifiedEncoding(choices, encodings, r1, theme1, inter, budget)
+    deid_dists2 = DeidentifiedEncoding(choices, encodings, r2, theme2, inter, budget)
+        
+    #match as many columns as possible
+    matchcols = MaxMatch(deid_dists1, deid_dists2, matcher)
+    
+    for m in matchcols:
+        cols |= 1 << col_keys[m]
+        
+    return(cols)    
+    
+    
+    
+##For rows r1 and r2, returns their maximally confusable subsets (as bitmasks) calculated according to the deidentified distinguisher sets
+def CompareTwoRows_Deidentified(choices, encodings, r1, r2, matcher="astar", budget=(None, None)):
+    mcsets = MaximalSets()
+                
+    #Compare every possible combinations of themes between the two rows
+    for theme1 in choices[r1]:
+        for theme2 in choices[r2]:
+            comp = CompareTwoSets_Deidentified(choices, encodings, r1, theme1, r2, theme2, matcher, budget)
+            if comp and MaskSize(comp)>1:
+                mcsets.add(comp)
+
+    #print(mcsets.masks())
+    return(mcsets.masks())
+    
+
+##Returns the distinct deidentified pairwise MC sets between row i and every later row, the process id and the
+##statistics of the process's encoding and multialignment caches
+##shared holds the chosen distinguishers of every row, the encoding cache (each worker process gets its own copy)
+##the matcher and the multialignment budget
+def PairwiseSetsforRow_Deidentified(shared, i):
+    choices, encodings, matcher, budget = shared
+    searches, closures = SnapshotSearchCounters(), dict(closure_stats)
+    rowsets = []
+    for j in range(i + 1, len(choices)):
+        pairwisesets = CompareTwoRows_Deidentified(choices, encodings, i, j, matcher, budget)
+        for p in range(len(pairwisesets)):
+            if pairwisesets[p] not in rowsets and MaskSize(pairwisesets[p])>1:
+                rowsets.append(pairwisesets[p])
+
+    return(rowsets, os.getpid(), encodings.stats(), multialign_cache.stats(), SearchCountersSince(searches), ClosureStatsSince(closures))
+
+
+##Returns all possible maximally confusable subsets (by plat column id numbers) for every row in the plat
+##Column sets are bitmasks throughout and are only turned back into frozensets on return
+##workers > 1 spreads the row pairs over a process pool; for a given seed the result does not depend on the number of workers
+##checkpoint is an optional file path: finished rows are appended to it, and a rerun skips the rows it already holds
+##matcher names the backend of Matchers.py that matches the distinguishers of two rows ("auto" picks one per match);
+##backends only differ in which columns they pick when a row pair has several largest matches
+##budget is the (expansions, seconds) budget of each multialignment (see approximateMultialign), (None, None) for none
+def FindMaximallyConfusableSubsets_Deidentified(rows, workers=1, seed=0, checkpoint=None, matcher="astar", budget=(None, None)):
+    mcsets_byrow = {}
+    mcsets = set()
+    todo = list(range(len(rows)))
+
+    if checkpoint:
+        ck = RowCheckpoint(checkpoint, RunKey(rows, "mcsets_deidentified/3", seed, matcher, list(budget)))
+        for i in ck.done:
+            mcsets_byrow[i+1] = ck.done[i]
+        todo = ck.remaining(todo)
+        print("Resuming with", len(todo), "of", len(rows), "rows left")
+
+    if todo:
+        #a row is only compared with later rows, so rows before the first unfinished one need no themes
+        start = min(todo)
+        subsets_bytheme = GetLargestSetsbyTheme(rows[start:])
+        choices = [None] * start + ChooseDistinguishers(rows[start:], subsets_bytheme, seed, start)
+        print("Sets by theme computed")
+
+        #deidentified encodings by (row, theme, set of columns), so each multialignment runs once rather than once per
+        #row pair; bounded by ENCODING_CACHE_ENTRIES (100000 entries by default)
+        encodings = AlignmentCache(CacheBound("ENCODING_CACHE_ENTRIES", 100000), None)
+        encoding_stats = {}
+        multialign_stats = {}
+        for i, (rowsets, pid, stats, mastats, searches, closures) in MapRows(PairwiseSetsforRow_Deidentified, (choices, encodings, matcher, budget), todo, workers):
+            print(i)
+            mcsets_byrow[i+1] = rowsets
+            encoding_stats[pid] = stats
+            multialign_stats[pid] = mastats
+            #a worker's searches and theme closures are not in this process's counters yet
+            if pid != os.getpid():
+                AddSearchCounters(searches)
+                AddClosureStats(closures)
+            if checkpoint:
+                ck.record(i, rowsets)
+
+        print("Encoding cache:", FormatCacheStats(MergeCacheStats(encoding_stats.values())))
+        print("Multialignment cache:", FormatCacheStats(MergeCacheStats(multialign_stats.values())))
+        #alignments the workers computed go from their own files into the store file
+        if multialign_store is not None:
+            multialign_store.merge()
+
+    if checkpoint:
+        ck.close()
+    
+    #print("Pairwise MC sets calculated")
+
+    mcsets = set()
+
+    #every intersection of a row's pairwise MC sets with more than one column is also an MC set
+    for row in range(1, len(mcsets_byrow)+1):
+        mcsets.update(IntersectionClosure(mcsets_byrow[row], minsize=2))
+                        
+        #print("Row", row, "calculations finished")
+
+    return(set([MaskColumns(m) for m in mcsets]))
+
+
+##User must provide plat in csv format as input
+##Optional: --workers N to compare row pairs in N processes, --seed S for the random choice among distinguishers,
+##--checkpoint FILE to record finished rows and resume from them, --matcher NAME for the matching backend (default astar),
+##--expansions N and/or --seconds S to bound each multialignment (default: no bound)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("plat")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--checkpoint")
+    parser.add_argument("--matcher", default="astar", choices=sorted(matchers) + ["auto"])
+    parser.add_argument("--expansions", type=int)
+    parser.add_argument("--seconds", type=float)
+    args = parser.parse_args()
+
+    with open(args.plat, encoding="utf8") as csvfile:
+        csvreader = csv.reader(csvfile, delimiter=',')
+        next(csvreader, None)
+        rows = list(csvreader)
+        mcsets = FindMaximallyConfusableSubsets_Deidentified(rows, workers=args.workers, seed=args.seed, checkpoint=args.checkpoint, matcher=args.matcher,
+                                                              budget=(args.expansions, args.seconds))
+
+        print("Number of maximally confusable sets (deid):", len(mcsets))
+        print("Maximally confusable sets by column index:", mcsets)
+        print("Alignment cache:", cache)
+        print("Theme closure:", closure_stats)
+        SaveMCSets("mcsets_deidentified", mcsets)
@@ -0,0 +1,112 @@
+#Per-row execution of the O(R^2) row-pair phase of MC set discovery
+#
+#The row-pair loop is split into one task per row i (comparing it with every
+#later row j). Tasks can run in a process pool; the data they need (the
+#per-row theme tables) is handed to each worker once when the pool starts
+#rather than with every task, and results come back in row order so the
+#output does not depend on the number of workers. Finished rows can be
+#recorded in a checkpoint so that an interrupted run resumes where it stopped.
+
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+
+_func = None
+_shared = None
+
+
+def _InitWorker(func, shared):
+    global _func, _shared
+    _func = func
+    _shared = shared
+
+
+def _RunRow(i):
+    return i, _func(_shared, i)
+
+
+##Calls func(shared, i) for every row i in rows (a list of row indices) and yields (i, result) in that order
+##func must be a module-level function so that it can be sent to worker processes
+def MapRows(func, shared, rows, workers=1):
+    if workers <= 1:
+        for i in rows:
+            yield i, func(shared, i)
+        return
+
+    with multiprocessing.Pool(workers, initializer=_InitWorker, initargs=(func, shared)) as pool:
+        for i, result in pool.imap(_RunRow, rows):
+            yield i, result
+
+
+##Random number generator for one row, so random choices do not depend on which worker runs the row
+def RowRandom(seed, i):
+    return random.Random("%d:%d" % (seed, i))
+
+
+##Hash identifying a plat and the parameters of a run, used to check that a checkpoint belongs to the run resuming it
+def RunKey(rows, *params):
+    digest = hashlib.sha256()
+    digest.update(json.dumps([rows, params], ensure_ascii=False).encode("utf8"))
+    return digest.hexdigest()
+
+
+class RowCheckpoint:
+    """Append-only record of finished rows of the row-pair phase
+
+    The file holds one JSON line per finished row after a header line with
+    the run key. Each row is flushed to disk as soon as it finishes, so an
+    interrupted run loses at most the rows in progress; a truncated last
+    line is ignored when the file is read back, and a truncated header
+    starts the file over.
+    """
+
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+        self.done = {}
+
+        lines = None
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, encoding="utf8") as ckfile:
+                lines = ckfile.read().split("\n")
+            try:
+                header = json.loads(lines[0])
+            except ValueError:
+                header = None
+            if not isinstance(header, dict):
+                #a header cut short by an interruption is the only line, and no row was recorded after it
+                if len(lines) > 1:
+                    raise ValueError("checkpoint %s is not valid: its first line is not a checkpoint header" % path)
+                lines = None
+            elif header.get("key") != key:
+                raise ValueError("checkpoint %s was written for a different plat or different parameters" % path)
+
+        if lines is not None:
+            for line in lines[1:]:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                self.done[record["row"]] = record["sets"]
+            self.out = open(path, "a", encoding="utf8")
+            if not lines[-1] == "":
+                self.out.write("\n")
+        else:
+            self.out = open(path, "w", encoding="utf8")
+            self.out.write(json.dumps({"key": key}) + "\n")
+            self.out.flush()
+
+    def remaining(self, rows):
+        """The rows of the given list that have not finished yet"""
+        return [i for i in rows if i not in self.done]
+
+    def record(self, i, sets):
+        self.done[i] = sets
+        self.out.write(json.dumps({"row": i, "sets": sets}) + "\n")
+        self.out.flush()
+        os.fsync(self.out.fileno())
+
+    def close(self):
+        self.out.close()
@@ -0,0 +1,143 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import random
+import time
+
+import MaximallyConfusableSubsets
+import MaximallyConfusableSubsets_Deidentified
+import ExtractDeidentifiedDists
+import EntropyCalculations
+from EditDistanceWithAlignment import cache, closure_stats
+from Artifacts import *
+from Matchers import matchers
+from approximateMultialign import multialign_cache
+from SearchCore import search_counters
+
+#Runs the whole pipeline (MC sets, deidentified MC sets, deidentified distinguishers and both entropy
+#matrices) in one process. The plat is read once and the alignment cache stays warm from
+#one stage to the next.
+#
+#Every stage result is saved (in the format of Artifacts.py) in a cache directory under a key made from a hash of the plat
+#content, the stage's parameters and the keys of the stages it reads from. A rerun reuses every stage
+#whose key has not changed: e.g. changing only an entropy parameter skips MC set discovery entirely.
+
+#bump a stage's version when a code change alters its output, so that stale cached results are not reused
+STAGE_VERSIONS = {
+    "mcsets": 1,
+    "mcsets_deidentified": 3,
+    "deidentified_dists": 2,
+    "entropymatrix": 1,
+    "entropymatrix_deidentified": 1,
+}
+
+
+##Key of a stage result: hash of the stage name and version plus everything its output depends on
+def StageKey(name, *parts):
+    digest = hashlib.sha256()
+    digest.update(json.dumps([name, STAGE_VERSIONS[name], parts]).encode("utf8"))
+    return digest.hexdigest()
+
+
+##Returns the path of a stage's result for this key, computing and saving the result first unless it is already cached
+##compute returns the arguments that save takes after the path
+def RunStage(name, key, compute, save, cachedir, force=()):
+    path = os.path.join(cachedir, "%s-%s" % (name, key[:16]))
+    if name not in force and os.path.exists(path):
+        print("%s: reusing %s" % (name, path))
+        return path
+
+    start = time.time()
+    save(path, *compute())
+    print("%s: computed in %.1fs" % (name, time.time() - start))
+    return path
+
+
+##budget is the (expansions, seconds) budget of each multialignment (see approximateMultialign), (None, None) for none
+def RunPipeline(platfile, workers=1, seed=0, cachedir="pipeline_cache", force=(), matcher="astar", budget=(None, None)):
+    with open(platfile, "rb") as platbytes:
+        plathash = hashlib.sha256(platbytes.read()).hexdigest()
+    with open(platfile, encoding="utf8") as csvfile:
+        csvreader = csv.reader(csvfile, delimiter=',')
+        next(csvreader, None)
+        rows = list(csvreader)
+
+    rowlabels = [row[0] for row in rows]
+
+    os.makedirs(cachedir, exist_ok=True)
+    paths = {}
+
+    def Entropy():
+        columns = list(LoadMCSets(paths["mcsets"]))
+        timings = []
+        matrix = EntropyCalculations.CalculateEntropy(columns, rows, workers=workers, timings=timings)
+        print("Slowest MC sets:")
+        EntropyCalculations.PrintSlowestSets(columns, timings)
+        return matrix, rowlabels, columns
+
+    def DeidentifiedEntropy():
+        dists = EntropyCalculations.GroupDistsBySet(LoadDeidentifiedDists(paths["deidentified_dists"]))
+        timings = []
+        matrix = EntropyCalculations.CalculateEntropy_Deidentified(rows, dists, workers=workers, timings=timings)
+        print("Slowest deidentified MC sets:")
+        EntropyCalculations.PrintSlowestSets(list(dists), timings)
+        return matrix, rowlabels, list(dists)
+
+    key_mcsets = StageKey("mcsets", plathash)
+    paths["mcsets"] = RunStage("mcsets", key_mcsets,
+        lambda: (MaximallyConfusableSubsets.FindMaximallyConfusableSubsets(rows, workers=workers),),
+        SaveMCSets, cachedir, force)
+
+    key_entropy = StageKey("entropymatrix", key_mcsets)
+    paths["entropymatrix"] = RunStage("entropymatrix", key_entropy, Entropy, SaveEntropyMatrix, cachedir, force)
+
+    key_mcsets_deid = StageKey("mcsets_deidentified", plathash, seed, matcher, list(budget))
+    paths["mcsets_deidentified"] = RunStage("mcsets_deidentified", key_mcsets_deid,
+        lambda: (MaximallyConfusableSubsets_Deidentified.FindMaximallyConfusableSubsets_Deidentified(rows, workers=workers, seed=seed,
+                                                                                      matcher=matcher, budget=budget),),
+        SaveMCSets, cachedir, force)
+
+    key_dists = StageKey("deidentified_dists", key_mcsets_deid, seed, list(budget))
+    paths["deidentified_dists"] = RunStage("deidentified_dists", key_dists,
+        lambda: (ExtractDeidentifiedDists.GetDists(LoadMCSets(paths["mcsets_deidentified"]), rows, random.Random(seed), budget),),
+        SaveDeidentifiedDists, cachedir, force)
+
+    key_entropy_deid = StageKey("entropymatrix_deidentified", key_dists)
+    paths["entropymatrix_deidentified"] = RunStage("entropymatrix_deidentified", key_entropy_deid, DeidentifiedEntropy,
+        SaveEntropyMatrix, cachedir, force)
+
+    return paths
+
+
+##User must provide plat in csv format as input
+##Writes the same results as running the four scripts one after another
+##Optional: --workers N, --seed S, --matcher NAME, --expansions N and --seconds S as for the MC set scripts, --cachedir DIR for the stage cache
+##(default pipeline_cache), --force STAGE (repeatable) to recompute a stage even if it is cached
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("plat")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--matcher", default="astar", choices=sorted(matchers) + ["auto"])
+    parser.add_argument("--expansions", type=int)
+    parser.add_argument("--seconds", type=float)
+    parser.add_argument("--cachedir", default="pipeline_cache")
+    parser.add_argument("--force", action="append", default=[], choices=sorted(STAGE_VERSIONS))
+    args = parser.parse_args()
+
+    paths = RunPipeline(args.plat, workers=args.workers, seed=args.seed, cachedir=args.cachedir, force=args.force, matcher=args.matcher,
+                        budget=(args.expansions, args.seconds))
+
+    for name in ("mcsets", "mcsets_deidentified", "deidentified_dists", "entropymatrix", "entropymatrix_deidentified"):
+        CopyArtifact(paths[name], name)
+
+    print("Number of maximally confusable sets:", len(LoadMCSets("mcsets")))
+    print("Number of maximally confusable sets (deid):", len(LoadMCSets("mcsets_deidentified")))
+    #caches belong to one process, so these are the main process's; the stages print their workers' merged statistics.
+    #Searches and theme closures run by workers are added to the main process's counters by the stages
+    print("Alignment cache (main process):", cache)
+    print("Multialignment cache (main process):", multialign_cache)
+    print("Theme closure:", closure_stats)
+    print("Searches:", search_counters)
@@ -0,0 +1,213 @@
+import time
+from heapq import heappush, heappop, heapify
+
+#Best-first search shared by the searches of the pipeline: multialignment (multialign.py), extending an alignment
+#by one string (approximateMultialign.py) and matching deidentified distinguishers (aStar_matching.py)
+#
+#A node provides complete(), successors(), key() and priority(), and orders by priority with <. Each kind of search
+#counts its work in its own entry of search_counters, so every search can be profiled in one place (Pipeline.py and
+#ExtractDeidentifiedDists.py print them when they finish):
+#  searches, expanded, generated: searches run, nodes expanded and successors generated
+#  reopened: nodes taken back from the closed set because they were reached again at a better priority
+#  queue peak: largest number of open nodes in any one search
+#  cutoffs: searches stopped by their step or time limit
+#  compactions: times a queue was rebuilt without its stale entries
+#  incumbents: complete nodes found by anytime searches (see BestFirst), each cheaper than the one before
+#  largest gap: largest cost gap an anytime search returned
+#Searches run in worker processes are counted there; workers report them with SearchCountersSince and the parent adds
+#them in with AddSearchCounters.
+
+search_counters = {}
+
+#counters that hold the largest value seen rather than a total
+PEAK_COUNTERS = ("queue peak", "largest gap")
+
+##Returns the counters of one kind of search, creating them on first use
+def SearchCounters(name):
+    return search_counters.setdefault(name, {"searches": 0, "expanded": 0, "generated": 0, "reopened": 0,
+                                             "queue peak": 0, "cutoffs": 0, "compactions": 0, "incumbents": 0, "largest gap": 0})
+
+
+##Zeroes the counters of every kind of search
+def ResetSearchCounters():
+    for counters in search_counters.values():
+        for name in counters:
+            counters[name] = 0
+
+
+##Copy of the counters of every kind of search, to pass to SearchCountersSince later
+def SnapshotSearchCounters():
+    return {name: dict(counters) for name, counters in search_counters.items()}
+
+
+##What this process has counted since before (a SnapshotSearchCounters): totals are differences, peaks are current
+def SearchCountersSince(before):
+    counts = {}
+    for name, counters in search_counters.items():
+        old = before.get(name, {})
+        counts[name] = {kk: vv if kk in PEAK_COUNTERS else vv - old.get(kk, 0) for kk, vv in counters.items()}
+    return counts
+
+
+##Adds counts another process reported with SearchCountersSince to the counters of this one
+def AddSearchCounters(counts):
+    for name, other in counts.items():
+        counters = SearchCounters(name)
+        for kk, vv in other.items():
+            counters[kk] = max(counters[kk], vv) if kk in PEAK_COUNTERS else counters[kk] + vv
+
+
+class PriorityQueue:
+    #see https://docs.python.org/3.8/library/heapq.html
+    #replaced entries stay in the heap, marked invalid, until popped; once they outnumber
+    #both the live entries and compactAt, the heap is rebuilt without them
+    def __init__(self, compactAt=1024):
+        self.heap = []
+        self.entries = {}
+        self.compactAt = compactAt
+        self.compactions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, entry):
+        key = entry.key()
+        current = self.entries.get(key)
+        if current is not None:
+            current.valid = False
+
+        self.entries[key] = entry
+        entry.valid = True
+        heappush(self.heap, entry)
+
+        stale = len(self.heap) - len(self.entries)
+        if stale > self.compactAt and stale > len(self.entries):
+            self.heap = [item for item in self.heap if item.valid]
+            heapify(self.heap)
+            self.compactions += 1
+
+    def remove(self, entry):
+        current = self.entries.pop(entry.key(), None)
+        if current is not None:
+            current.valid = False
+
+    def update(self, entry):
+        current = self.entries.get(entry.key())
+        if current is None or entry.priority() < current.priority():
+            self.add(entry)
+
+    ##Drops the entries keep rejects and restores the heap order after the priorities of entries changed
+    def reorder(self, keep):
+        for entry in list(self.entries.values()):
+            if not keep(entry):
+                self.remove(entry)
+        self.heap = list(self.entries.values())
+        heapify(self.heap)
+
+    def popMin(self):
+        while self.heap:
+            nxt = heappop(self.heap)
+            if nxt.valid:
+                self.remove(nxt)
+                return nxt
+
+
+##Follows the best successor from node (by cost + heuristic) until it is complete
+def GreedyComplete(node):
+    while not node.complete():
+        node = min(node.successors(), key=lambda succ: (succ.cost + succ.heuristic, succ.heuristic))
+    return node
+
+
+##Expands the best open node until the best one is complete, and returns it
+##counters: the counters to count in (see SearchCounters)
+##cutoff: largest number of nodes to expand, seconds: longest time to search; past either, returns None
+##Expanded nodes go to a closed set by key and are only searched again if reached at a better priority.
+##Also returns None if the open nodes run out. verbose > 1 prints every node taken from the queue.
+##
+##weight > 1 makes the search anytime: nodes are ranked by cost + weight * heuristic (they need cost and heuristic
+##and reweight(weight), which sets the priority), so a complete node, the incumbent, turns up early. The search then
+##goes on: each cheaper complete node replaces the incumbent and moves the weight halfway to 1, and open nodes that
+##cannot beat the incumbent are dropped. Past cutoff or seconds, the incumbent is returned (or, if there is none yet,
+##the open node closest to complete is completed greedily) along with its gap: how much cheaper than it a solution
+##could still be. The gap is 0 once the open nodes run out; (None, None) if they run out without a complete node.
+def BestFirst(node, counters, verbose=False, cutoff=None, seconds=None, weight=None):
+    queue = PriorityQueue()
+    closed = {}
+    best = node
+    incumbent = None
+    steps = 0
+    generated = 0
+    peak = 0
+    deadline = None if seconds is None else time.perf_counter() + seconds
+    counters["searches"] += 1
+    if weight is not None:
+        node.reweight(weight)
+
+    #nodes are only reopened at a lower cost in an anytime search, as their priorities change with the weight
+    rank = (lambda nd: nd.priority()) if weight is None else (lambda nd: nd.cost)
+
+    try:
+        while True:
+            if best.complete():
+                if weight is None:
+                    return best
+                incumbent = best
+                counters["incumbents"] += 1
+                weight = 1 + (weight - 1) / 2
+                for entry in queue.entries.values():
+                    entry.reweight(weight)
+                queue.reorder(lambda entry: entry.cost + entry.heuristic < incumbent.cost)
+            else:
+                if (cutoff is not None and steps >= cutoff) or (deadline is not None and time.perf_counter() > deadline):
+                    counters["cutoffs"] += 1
+                    if weight is None:
+                        return None
+                    queue.add(best)
+                    break
+
+                closed[best.key()] = rank(best)
+                successors = best.successors()
+                generated += len(successors)
+                for succ in successors:
+                    if weight is not None:
+                        if incumbent is not None and succ.cost + succ.heuristic >= incumbent.cost:
+                            continue
+                        succ.reweight(weight)
+                    key = succ.key()
+                    if key in closed:
+                        if not rank(succ) < closed[key]:
+                            continue
+                        del closed[key]
+                        counters["reopened"] += 1
+                    queue.update(succ)
+
+                if len(queue.entries) > peak:
+                    peak = len(queue.entries)
+                steps += 1
+
+            best = queue.popMin()
+            if best is None:
+                if weight is None:
+                    return None
+                break
+            if verbose > 1:
+                print("queue size", len(queue), "current priority", best.priority())
+                print(best)
+    finally:
+        #counted locally and added once, as the loop is hot
+        counters["expanded"] += steps
+        counters["generated"] += generated
+        counters["queue peak"] = max(counters["queue peak"], peak)
+        counters["compactions"] += queue.compactions
+
+    live = list(queue.entries.values())
+    if incumbent is None:
+        if not live:
+            return None, None
+        incumbent = GreedyComplete(min(live, key=lambda nd: (nd.heuristic, nd.cost)))
+
+    gap = max([0] + [incumbent.cost - (nd.cost + nd.heuristic) for nd in live])
+    if gap > counters["largest gap"]:
+        counters["largest gap"] = gap
+    return incumbent, gap
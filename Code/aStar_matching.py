@@ -1,240 +1,387 @@
-from collections import defaultdict, Counter
-import random
-from heapq import *
-from EditDistanceWithAlignment import *
-import sys
-
-class MaxMatchNode:
-    def __init__(self, value, data, probvars, assnmts={}):
-        """value: current number of cols matched
-        data: columns in problem
-        probvars: 0 for undecided, -1 for no match, 1 for match
-        assnmts: variable-to-variable matching
-        """
-        self.value = value
-        self.data = data
-        self.probvars = probvars
-        self.assnmts = assnmts
-        self.hVal = None
-        
-    def __str__(self):
-        res = "[%d/%d] " % (-self.value, -self.heuristic())
-        for p in self.probvars:
-            res += "%i " % p
-
-        res += "{" + ", ".join(["%s=%s" % (kk, vv) for kk, vv in self.assnmts.items()]) + "}"
-        return res
-
-    def complete(self):
-        for p in self.probvars:
-            if p == 0: #check if any columns still unknown
-                return False
-
-        return True
-
-    def key(self):
-        return tuple(self.probvars)
-
-    def priority(self):
-        return self.value + self.heuristic()
-
-    def __eq__(self, other):
-        return self.key() == other.key()
-
-    def __lt__(self, other):
-        return (self.priority() < other.priority())
-
-    def heuristic(self):
-        if self.hVal is not None:
-            return self.hVal
-        else:
-            self.hVal = self.computeHeuristic()
-            return self.hVal    
-    
-    def computeHeuristic(self):
-        scores = 0
-        
-        for p in self.probvars:
-            if p==0:
-                scores-=1
-        
-        return(scores)
-            
-    def successors(self):           
-        res = []
-
-        newcol = self.probvars.index(0) #find first instance of zero
-            
-        #the new column not matching is always a possible successor
-        s0 = self.probvars[:]
-        s0[newcol] = -1
-        newassnmts = dict(self.assnmts.items())
-        res.append(MaxMatchNode(self.value, self.data, s0, newassnmts))
-
-        #update assignments for new column matching    
-        newassnmts = dict(self.assnmts.items())
-        assignedBs = set(newassnmts.values())
-
-        s1 = self.probvars[:]
-        s1[newcol] = 1
-
-        col1 = self.data[0][newcol]
-        col2 = self.data[1][newcol]
-        
-        for ci, cj in zip(col1, col2):
-            ciVal = newassnmts.get(ci, None)
-            #print("matching up", ci, cj, ciVal)
-
-            if ciVal is None and cj not in assignedBs:
-                newassnmts[ci] = cj #update
-                assignedBs.add(cj)
-            elif ciVal != cj:
-                return res #already has a value and it's bad
-
-        #go through remaining columns: which are still unassigned?
-        for col, current in enumerate(s1):
-            if current == 0:
-                col1 = self.data[0][col]
-                col2 = self.data[1][col]
-                matched = 1
-                for ci, cj in zip(col1, col2):
-                    ciVal = newassnmts.get(ci, None)
-                    if ciVal is None and cj not in assignedBs:
-                        matched = 0
-                        break
-                    elif ciVal != cj:
-                        matched = -1
-                        break
-
-                s1[col] = matched
-
-        #a successor matching is possible only if it passed the earlier check
-        res.append(MaxMatchNode(-s1.count(1), self.data, s1, newassnmts))
-
-        return res
-
-class PriorityQueue:
-    #see https://docs.python.org/3.8/library/heapq.html
-    def __init__(self):
-        self.heap = []
-        self.entries = {}
-
-    def __len__(self):
-        return len(self.entries)
-
-    def add(self, entry):
-        if entry.key() in self.entries:
-            self.remove(entry)
-
-        self.entries[entry.key()] = entry
-        entry.valid = True
-        heappush(self.heap, entry)
-
-    def remove(self, entry):
-        current = self.entries.get(entry.key())
-        if current is not None:
-            current.valid = False
-            del self.entries[entry.key()]
-
-    def update(self, entry):
-        current = self.entries.get(entry.key())            
-        if current and (entry.priority() < current.priority()):
-            self.remove(entry)
-            self.add(entry)
-        elif not current:
-            self.add(entry)
-
-    def popMin(self):
-        while self.heap:
-            nxt = heappop(self.heap)
-            if nxt.valid:
-                self.remove(nxt)
-                return nxt
-
-def aStar_match(node, verbose=False):
-    queue = PriorityQueue()
-    best = node
-    steps = 0
-    
-    while not best.complete():
-        for succ in best.successors():
-            #print("\t\t", succ)
-            queue.update(succ)
-            
-        best = queue.popMin()
-        if verbose > 1:
-            print("queue size", len(queue), "current priority", best.priority())
-            print(best)
-
-        steps += 1
-
-    if verbose:
-        print("finished in", steps, "steps with max match value", -best.value)
-
-    return best
-
-def extractMatch(node):
-    cols = node.probvars
-    match = []
-    for ix, c in enumerate(cols):
-        if c==1:
-            match.append(ix)
-        
-    return match
-
-
-def printMatch(data, node):
-    cols = node.probvars
-    matchingcols = [[], []]
-    
-    for r in range(2):
-        for ix, val in enumerate(data[r]):
-            if cols[ix]==1:
-                matchingcols[r].append(val)
-                
-    print(matchingcols)
-    print("under matching", end=" ")
-    for ai1, ai2 in node.assnmts.items():
-        print(ai1, "=", ai2, end=", ")
-    print()
-    print()
-
-
-if __name__ == "__main__":
-    #trivially matches
-    data = [[[1, 2], [2, 3], [3, 4]], [[1, 2], [2, 3], [3, 4]]]
-    mx = MaxMatchNode(0, data, [0 for x in range(len(data[0]))])
-    match = aStar_match(mx, verbose=1)
-    printMatch(data, match)
-    
-    #trivially matches
-    data = [[[1, 2], [2, 3], [3, 4]], [[9, 10], [10, 11], [11, 12]]]
-    mx = MaxMatchNode(0, data, [0 for x in range(len(data[0]))])
-    match = aStar_match(mx, verbose=1)
-    printMatch(data, match)
-
-    #only one matches
-    data = [[[1, 2], [2, 3], [3, 4]], [[9, 10], [9, 10], [9, 10]]]
-    mx = MaxMatchNode(0, data, [0 for x in range(len(data[0]))])
-    match = aStar_match(mx, verbose=1)
-    printMatch(data, match)
-    
-    #two match
-    data = [[[1, 2], [2, 3], [3, 4]], [[9, 10], [10, 11], [9, 10]]]
-    mx = MaxMatchNode(0, data, [0 for x in range(len(data[0]))])
-    match = aStar_match(mx, verbose=1)
-    printMatch(data, match)
-    
-    #three match
-    data = [[[1, 2],  [2, 3],    [3, 4],   [1, 4]],
-            [[9, 10], [10, 11], [12, 11], [9, 11]]]
-    mx = MaxMatchNode(0, data, [0 for x in range(len(data[0]))])
-    match = aStar_match(mx, verbose=1)
-    printMatch(data, match)
-
-    
-    #same three match but the second and fourth columns have swapped positions
-    data = [[[1, 2], [3, 4], [1, 4], [2,3]], [[9, 10], [12, 11], [9, 11], [10,11]]]
-    mx = MaxMatchNode(0, data, [0 for x in range(len(data[0]))])
-    match = aStar_match(mx, verbose=1)
-    printMatch(data, match)
+from collections import defaultdict, Counter
+import random
+from heapq import *
+from EditDistanceWithAlignment import *
+from ColumnSets import PopCount
+from SearchCore import PriorityQueue, SearchCounters, BestFirst
+import sys
+
+class MatchProblem:
+    """What all nodes of one search share: the symbols of each column and
+    the search options. Each second-row symbol gets a bit of its own (bits)
+    and colbits holds the bits of each column, so the symbols a mapping
+    maps to fit in one int. The pairs of a column are
+    zip(firsts[col], colbits[col]), up to the shorter of the two.
+
+    bound: "count" bounds the columns still to match by the number of
+    undecided columns; "cliques" by the number of cliques in a greedy
+    clique cover of the conflict graph of the undecided columns, since
+    at most one column of a set of pairwise conflicting columns can match
+    order: "plat" decides columns in plat order; "constrained" decides
+    first the undecided column that conflicts with most other undecided
+    columns (columns that cannot match on their own come first of all)"""
+
+    __slots__ = ("ncols", "full", "firsts", "colbits", "bits", "bound", "order", "conflicts", "unmatchable")
+
+    def __init__(self, data, ncols, bound="count", order="plat"):
+        if bound not in ("count", "cliques") or order not in ("plat", "constrained"):
+            raise ValueError("unknown bound %r or column order %r" % (bound, order))
+        self.ncols = ncols
+        self.full = (1 << ncols) - 1
+        self.firsts = data[0]
+        bits = self.bits = {}
+        self.colbits = []
+        for col in data[1][:ncols]:
+            colbits = []
+            for cj in col:
+                cjbit = bits.get(cj)
+                if cjbit is None:
+                    cjbit = bits[cj] = 1 << len(bits)
+                colbits.append(cjbit)
+            self.colbits.append(colbits)
+        self.bound = bound
+        self.order = order
+        self.conflicts = None
+        self.unmatchable = 0
+        if bound != "count" or order != "plat":
+            self.findConflicts()
+
+    def symbolBit(self, cj):
+        """Bit of a second-row symbol"""
+        if cj not in self.bits:
+            self.bits[cj] = 1 << len(self.bits)
+        return self.bits[cj]
+
+    def symbol(self, cjbit):
+        """Second-row symbol of a bit"""
+        for cj, bit in self.bits.items():
+            if bit == cjbit:
+                return cj
+
+    def findConflicts(self):
+        """Two columns conflict when no one mapping can match both: they map
+        one symbol to two different symbols, or two symbols to one. A column
+        that conflicts with itself can never match. The columns that are
+        still undecided agree with the mapping built so far, so any conflict
+        between them is already there in their own pairs."""
+        maps = []
+        for col, colbits in enumerate(self.colbits):
+            forward = {}
+            backward = {}
+            for ci, cj in zip(self.firsts[col], colbits):
+                if forward.setdefault(ci, cj) != cj or backward.setdefault(cj, ci) != ci:
+                    self.unmatchable |= 1 << col
+            maps.append((forward, backward))
+
+        self.conflicts = [0 for col in self.colbits]
+        for colA in range(len(maps)):
+            forwardA, backwardA = maps[colA]
+            for colB in range(colA + 1, len(maps)):
+                forwardB, backwardB = maps[colB]
+                if any([forwardB.get(ci, cj) != cj for ci, cj in forwardA.items()]) or \
+                   any([backwardB.get(cj, ci) != ci for cj, ci in backwardA.items()]):
+                    self.conflicts[colA] |= 1 << colB
+                    self.conflicts[colB] |= 1 << colA
+
+    def upperBound(self, undecided):
+        """Most columns among undecided that can still match"""
+        if self.bound == "count":
+            return PopCount(undecided)
+
+        #greedy clique cover: each column joins the first clique it conflicts with entirely
+        cliques = []
+        rest = undecided & ~self.unmatchable
+        while rest:
+            bit = rest & -rest
+            rest ^= bit
+            conflicts = self.conflicts[bit.bit_length() - 1]
+            for ix, clique in enumerate(cliques):
+                if clique & conflicts == clique:
+                    cliques[ix] = clique | bit
+                    break
+            else:
+                cliques.append(bit)
+
+        return len(cliques)
+
+    def nextColumn(self, undecided):
+        """Bit of the undecided column to decide next"""
+        if self.order == "plat":
+            return undecided & -undecided
+
+        unmatchable = undecided & self.unmatchable
+        if unmatchable:
+            return unmatchable & -unmatchable
+
+        best = 0
+        mostConflicts = -1
+        rest = undecided
+        while rest:
+            bit = rest & -rest
+            rest ^= bit
+            nconflicts = PopCount(self.conflicts[bit.bit_length() - 1] & undecided)
+            if nconflicts > mostConflicts:
+                best = bit
+                mostConflicts = nconflicts
+
+        return best
+
+class MaxMatchNode:
+    """Search node for the largest set of columns matched under one
+    symbol-to-symbol mapping.
+
+    The column states are two bitmasks: bit i of matched is set when
+    column i matches, bit i of rejected when it does not, and columns in
+    neither are undecided. The mapping (assigned) takes symbols to the
+    bits of MatchProblem, and the bits it maps to are a bitmask too
+    (assignedBs). The mapping is shared between nodes and never changed
+    once built: a successor that adds no pairs keeps its parent's, and
+    one that does copies it once, so no node rebuilds the mapping."""
+
+    __slots__ = ("value", "problem", "matched", "rejected", "assigned", "assignedBs", "keyVal", "prio", "valid")
+
+    def __init__(self, value, data, probvars, assnmts={}, bound="count", order="plat"):
+        """value: current number of cols matched
+        data: columns in problem
+        probvars: 0 for undecided, -1 for no match, 1 for match
+        assnmts: variable-to-variable matching
+        bound, order: search options, see MatchProblem
+        """
+        problem = self.problem = MatchProblem(data, len(probvars), bound, order)
+        self.value = value
+        self.matched = self.rejected = 0
+        for ix, p in enumerate(probvars):
+            if p == 1:
+                self.matched |= 1 << ix
+            elif p == -1:
+                self.rejected |= 1 << ix
+        self.assigned = {}
+        self.assignedBs = 0
+        for ci, cj in assnmts.items():
+            self.assigned[ci] = problem.symbolBit(cj)
+            self.assignedBs |= self.assigned[ci]
+        self.keyVal = self.matched << problem.ncols | self.rejected
+        self.prio = value + self.computeHeuristic()
+
+    @classmethod
+    def extend(cls, parent, value, matched, rejected, assigned, assignedBs):
+        node = cls.__new__(cls)
+        problem = node.problem = parent.problem
+        node.value = value
+        node.matched = matched
+        node.rejected = rejected
+        node.assigned = assigned
+        node.assignedBs = assignedBs
+        #the queue and heap comparisons read key and prio many times, so they are worked out once here
+        node.keyVal = matched << problem.ncols | rejected
+        node.prio = value - problem.upperBound(problem.full & ~(matched | rejected))
+        return node
+
+    @property
+    def ncols(self):
+        return self.problem.ncols
+
+    @property
+    def probvars(self):
+        return [1 if self.matched >> ix & 1 else -1 if self.rejected >> ix & 1 else 0 for ix in range(self.ncols)]
+
+    @property
+    def assnmts(self):
+        """The whole mapping, in the order its pairs were added"""
+        return {ci: self.problem.symbol(cjbit) for ci, cjbit in self.assigned.items()}
+        
+    def __str__(self):
+        res = "[%d/%d] " % (-self.value, -self.heuristic())
+        for p in self.probvars:
+            res += "%i " % p
+
+        res += "{" + ", ".join(["%s=%s" % (kk, vv) for kk, vv in self.assnmts.items()]) + "}"
+        return res
+
+    def undecided(self):
+        return self.problem.full & ~(self.matched | self.rejected)
+
+    def complete(self):
+        return not self.undecided() #check if any columns still unknown
+
+    def key(self):
+        return self.keyVal
+
+    def priority(self):
+        return self.prio
+
+    def __eq__(self, other):
+        return self.key() == other.key()
+
+    def __lt__(self, other):
+        return (self.prio < other.prio)
+
+    def heuristic(self):
+        return self.prio - self.value
+    
+    def computeHeuristic(self):
+        return(-self.problem.upperBound(self.undecided()))
+            
+    def successors(self):           
+        problem = self.problem
+        firsts = problem.firsts
+        colbits = problem.colbits
+        assigned = self.assigned
+        assignedBs = self.assignedBs
+
+        undecided = problem.full & ~(self.matched | self.rejected)
+        bit = problem.nextColumn(undecided)
+        newcol = bit.bit_length() - 1
+            
+        #the new column not matching is always a possible successor
+        res = [MaxMatchNode.extend(self, self.value, self.matched, self.rejected | bit, assigned, assignedBs)]
+
+        #update assignments for new column matching; the parent's mapping
+        #is copied only when the column adds a pair to it
+        for ci, cj in zip(firsts[newcol], colbits[newcol]):
+            ciVal = assigned.get(ci, None)
+            #print("matching up", ci, cj, ciVal)
+
+            if ciVal is None and not assignedBs & cj:
+                if assigned is self.assigned:
+                    assigned = assigned.copy()
+                assigned[ci] = cj #update
+                assignedBs |= cj
+            elif ciVal != cj:
+                return res #already has a value and it's bad
+
+        #go through remaining columns: which are still unassigned?
+        get = assigned.get
+        matched = self.matched | bit
+        rejected = self.rejected
+        rest = undecided & ~bit
+        while rest:
+            colbit = rest & -rest
+            rest ^= colbit
+            col = colbit.bit_length() - 1
+            for ci, cj in zip(firsts[col], colbits[col]):
+                ciVal = get(ci, None)
+                if ciVal is None and not assignedBs & cj:
+                    break
+                elif ciVal != cj:
+                    rejected |= colbit
+                    break
+            else:
+                matched |= colbit
+
+        #a successor matching is possible only if it passed the earlier check
+        res.append(MaxMatchNode.extend(self, -PopCount(matched), matched, rejected, assigned, assignedBs))
+
+        return res
+
+#searches run, nodes expanded, successors generated etc. by aStar_match (see SearchCore.py)
+search_stats = SearchCounters("matching")
+
+def aStar_match(node, verbose=False):
+    expanded = search_stats["expanded"]
+    best = BestFirst(node, search_stats, verbose=verbose)
+
+    if verbose:
+        print("finished in", search_stats["expanded"] - expanded, "steps with max match value", -best.value)
+
+    return best
+
+def fullMatch(rowA, rowB):
+    """Decides whether aStar_match would match every column of rowA with
+    rowB, without searching: the symbol mapping is forced by the columns,
+    so it is extended column by column and the first conflict fails.
+    As in MaxMatchNode, a pair of columns is compared up to the length
+    of the shorter one."""
+    forward = {}
+    backward = {}
+    for colA, colB in zip(rowA, rowB):
+        for ci, cj in zip(colA, colB):
+            ciVal = forward.get(ci, None)
+            if ciVal is None:
+                if cj in backward:
+                    return False
+                forward[ci] = cj
+                backward[cj] = ci
+            elif ciVal != cj:
+                return False
+
+    return True
+
+def canonicalSignature(cols):
+    """Relabels the symbols of a row's columns in order of first occurrence.
+    Two rows get the same signature exactly when some one-to-one mapping
+    of symbols turns every column of one into the same column of the
+    other. For rows whose columns have the same lengths, that is when
+    aStar_match (and fullMatch) match all their columns; aStar_match only
+    compares a pair of columns up to the length of the shorter one."""
+    labels = {}
+    sig = []
+    for col in cols:
+        sig.append(tuple([labels.setdefault(sym, len(labels)) for sym in col]))
+
+    return tuple(sig)
+
+def extractMatch(node):
+    match = []
+    for ix in range(node.ncols):
+        if node.matched >> ix & 1:
+            match.append(ix)
+        
+    return match
+
+
+def printMatch(data, node):
+    cols = node.probvars
+    matchingcols = [[], []]
+    
+    for r in range(2):
+        for ix, val in enumerate(data[r]):
+            if cols[ix]==1:
+                matchingcols[r].append(val)
+                
+    print(matchingcols)
+    print("under matching", end=" ")
+    for ai1, ai2 in node.assnmts.items():
+        print(ai1, "=", ai2, end=", ")
+    print()
+    print()
+
+
+if __name__ == "__main__":
+    #trivially matches
+    data = [[[1, 2], [2, 3], [3, 4]], [[1, 2], [2, 3], [3, 4]]]
+    mx = MaxMatchNode(0, data, [0 for x in range(len(data[0]))])
+    match = aStar_match(mx, verbose=1)
+    printMatch(data, match)
+    
+    #trivially matches
+    data = [[[1, 2], [2, 3], [3, 4]], [[9, 10], [10, 11], [11, 12]]]
+    mx = MaxMatchNode(0, data, [0 for x in range(len(data[0]))])
+    match = aStar_match(mx, verbose=1)
+    printMatch(data, match)
+
+    #only one matches
+    data = [[[1, 2], [2, 3], [3, 4]], [[9, 10], [9, 10], [9, 10]]]
+    mx = MaxMatchNode(0, data, [0 for x in range(len(data[0]))])
+    match = aStar_match(mx, verbose=1)
+    printMatch(data, match)
+    
+    #two match
+    data = [[[1, 2], [2, 3], [3, 4]], [[9, 10], [10, 11], [9, 10]]]
+    mx = MaxMatchNode(0, data, [0 for x in range(len(data[0]))])
+    match = aStar_match(mx, verbose=1)
+    printMatch(data, match)
+    
+    #three match
+    data = [[[1, 2],  [2, 3],    [3, 4],   [1, 4]],
+            [[9, 10], [10, 11], [12, 11], [9, 11]]]
+    mx = MaxMatchNode(0, data, [0 for x in range(len(data[0]))])
+    match = aStar_match(mx, verbose=1)
+    printMatch(data, match)
+
+    
+    #same three match but the second and fourth columns have swapped positions
+    data = [[[1, 2], [3, 4], [1, 4], [2,3]], [[9, 10], [12, 11], [9, 11], [10,11]]]
+    mx = MaxMatchNode(0, data, [0 for x in range(len(data[0]))])
+    match = aStar_match(mx, verbose=1)
+    printMatch(data, match)
@@ -1,193 +1,450 @@
-from multialign import *
-import sys
-import random
-import pickle
-import numpy as np
-
-class ExtendAlignNode:
-    def __init__(self, cost, ptr, layer, solution, string, charAtLayer):
-        self.cost = cost
-        self.ptr = ptr
-        self.layer = layer
-        self.solution = solution
-        self.string = string
-        self.charAtLayer = charAtLayer
-        self.heuristic = self.computeHeuristic()
-
-    def successors(self):
-        res = []
-        #we can align the next char at any position it matches
-        #or give it its own symbol
-        nextChar = self.string[self.ptr]
-        nextSym = self.layer - 1
-        for layer in range(nextSym, 0, -1):
-            charAtLayer = self.charAtLayer[layer]
-            if charAtLayer == nextChar:
-                newSol = self.solution[:] + [layer]
-                res.append(ExtendAlignNode(self.cost, self.ptr + 1, layer, newSol, self.string, self.charAtLayer))
-
-        newSol = self.solution[:] + ["NSYM"]
-        res.append(ExtendAlignNode(self.cost + 1, self.ptr + 1, self.layer, newSol, self.string, self.charAtLayer))
-
-        return res
-
-    def __str__(self):
-        res = "[%d/%d] " % (self.cost, self.heuristic)
-        for (si, pi) in zip(self.string, self.solution):
-            res += "%s:%d " % (si, pi)
-        return res
-
-    def complete(self):
-        return self.ptr == len(self.string)
-
-    def key(self):
-        return self.ptr, tuple(self.solution)
-
-    def priority(self):
-        return self.cost + self.heuristic, self.heuristic
-
-    def __eq__(self, other):
-        return self.key() == other.key()
-
-    def __lt__(self, other):
-        return (self.priority() < other.priority())
-
-    def computeHeuristic(self):
-        ownBag = {}
-        for ch in self.string[self.ptr:]:
-            ownBag[ch] = ownBag.get(ch, 0) + 1
-
-        otherBag = {}
-        for layer, ch in self.charAtLayer.items():
-            if layer < self.layer:
-                otherBag[ch] = otherBag.get(ch, 0) + 1
-                
-        res = 0
-        for ch, ct in ownBag.items():
-            val = ct - otherBag.get(ch, 0)
-            if ct > 0:
-                res += ct
-
-        return res
-
-def incrementAll(extracted, sym):
-    for item in extracted:
-        for ii in range(len(item)):
-            if item[ii] >= sym:
-                item[ii] += 1
-
-def renumber(extracted, draftAssignments):
-    for ii, sym in enumerate(draftAssignments):
-        if sym == "NSYM":
-            if ii == 0:
-                prevSym = max([max(xx) for xx in extracted if len(xx)]) + 1
-            else:
-                prevSym = draftAssignments[ii - 1]
-
-            incrementAll(extracted, prevSym)
-            for jj in range(ii):
-                draftAssignments[jj] += 1
-            draftAssignments[ii] = prevSym
-
-    return draftAssignments
-
-def incrementalMerge(string, ind, strs, extracted):
-    charAtLayer = {}
-    for si, sol in zip(strs, extracted):
-        #print(si, sol)
-        for ch, layer in zip(si, sol):
-            #print(ch, layer)
-            assert(charAtLayer.get(layer, ch) == ch)
-            charAtLayer[layer] = ch
-
-    #for layer, ch in sorted(charAtLayer.items(), reverse=True):
-    #    print(layer, "<->", ch)
-    #print()
-
-    node = ExtendAlignNode(0, 0, max(charAtLayer.keys()) + 1, [], string, charAtLayer)
-    best = aStar(node, verbose=0)
-    solution = best.solution
-    #print("solution", solution)
-    if "NSYM" in solution:
-        solution = renumber(extracted, solution)
-
-    extracted.append(solution)
-
-def selectAndAlign(dists, verbose=False, nSelect=10):
-    #I've also tried 25 as the initial selection
-    if dists:
-        maxSteps = 5000
-    else:
-        maxSteps = 100
-    select = min(len(dists), nSelect)
-    sol = None
-    while True:
-        if verbose:
-            print("\tChecking with", select, "distinguishers")
-        core = dists[:select]
-        mx1 = MultiAlignNode(0, core, [0 for xx in range(len(core))], prev=None, action=[])
-        sol = aStar(mx1, verbose=verbose, cutoff=maxSteps)
-        if sol is not None:
-            break
-
-        if select > 4:
-            select = select // 2
-        else:
-            maxSteps = None
-        
-    extracted = extract(sol)
-    return select, extracted
-
-def approximateMultialign(dists):
-    original = list(enumerate(dists))
-    byLength = sorted(original, key=lambda xx: len(xx[1]), reverse=True)
-    dists = [xx[1] for xx in byLength]
-    order = [xx[0] for xx in byLength]
-
-    verbose = False #len(dists) > 25
-    if verbose:
-        print(len(dists), "distinguishers to process")
-
-    select, extracted = selectAndAlign(dists, verbose=verbose)
-    core = dists[:select]
-    remaining = dists[select:]
-
-    if verbose:
-        print("\tFound initial solution with", select, "elements")
-    #printAlignment2(core, extracted)
-
-    for ii in range(select, len(dists)):
-        si = dists[ii]
-        #print("adding", si)
-
-        incrementalMerge(si, ii, core, extracted)
-        select += 1
-        core = dists[:select]
-        #print()
-        #printAlignment2(core, extracted)
-        #print()
-
-    final = [None for xx in original]
-    for index, sol in zip(order, extracted):
-        final[index] = sol
-
-    return final
-
-if __name__ == "__main__":
-    dists = pickle.load(open(sys.argv[1], 'rb'))
-    print(len(dists))
-    print(dists)
-
-    sol = approximateMultialign(dists)
-    print("final cost", max([ex[0] for ex in sol if ex]))
-    print(sol)
-    printAlignment2(dists, sol)
-
-    reduceAdjacentSymbols(sol)
-    assert(0)
-
-    print("real alignment")
-
-    mx1 = MultiAlignNode(0, dists, [0 for xx in range(len(dists))], prev=None, action=[])
-    sol = aStar(mx1, verbose=1, cutoff=None)
-    print(sol)
+from multialign import *
+from SearchCore import SearchCounters, BestFirst
+import os
+import sys
+import glob
+import json
+import multiprocessing
+import random
+import pickle
+import numpy as np
+from EditDistanceWithAlignment import AlignmentCache, CacheBound
+
+#Multialignment of the distinguishers of an MC set, used by the deidentified scripts
+#
+#The first distinguishers are aligned exactly (multialign.py), and the others are merged into that alignment one at
+#a time. Without a budget, an exact alignment that takes too long is retried with fewer distinguishers. With a budget
+#of search expansions and/or seconds (--expansions and --seconds of the scripts), the best alignment found within it
+#is used instead; the "anytime multialign" search counters record how often the budget ran out and how far from
+#optimal the alignments may be.
+#
+#Many rows share the same distinguishers for a set of columns, possibly in another order, so every alignment is
+#memoised under the sorted distinguishers (see approximateMultialign). MULTIALIGN_CACHE_ENTRIES bounds the memo
+#(100000 entries by default), and MULTIALIGN_CACHE_FILE names a file that keeps the alignments across runs.
+
+#searches run, nodes expanded etc. when extending an alignment by one string (see SearchCore.py)
+incremental_stats = SearchCounters("incremental")
+
+class ExtendAlignNode:
+    """Search node for aligning one more string to a fixed set of layers
+
+    Layers are numbered bottom to top; each char of the string goes to a
+    layer with the same char, below the layer of the previous char, or to
+    a new symbol (NSYM) at a cost of 1. A node only holds its last choice
+    and a pointer to its parent, so a child costs one small object rather
+    than a copy of the solution so far."""
+
+    __slots__ = ("cost", "ptr", "layer", "parent", "sym", "path", "string", "layersByChar", "heuristic", "prio", "valid")
+
+    def __init__(self, cost, ptr, layer, solution, string, charAtLayer):
+        self.cost = cost
+        self.ptr = ptr
+        self.layer = layer
+        self.parent = None
+        self.sym = None
+        self.path = tuple(solution)
+        self.string = string
+        #layers holding each char, top first, shared by all nodes of the search
+        self.layersByChar = {}
+        for layer in sorted(charAtLayer, reverse=True):
+            if layer > 0:
+                self.layersByChar.setdefault(charAtLayer[layer], []).append(layer)
+        self.heuristic = self.computeHeuristic()
+        self.prio = (self.cost + self.heuristic, self.heuristic)
+
+    @classmethod
+    def extend(cls, parent, cost, layer, sym):
+        node = cls.__new__(cls)
+        node.cost = cost
+        node.ptr = parent.ptr + 1
+        node.layer = layer
+        node.parent = parent
+        node.sym = sym
+        #the key compares whole solutions; nesting the choices builds it without copying
+        node.path = (parent.path, sym)
+        node.string = parent.string
+        node.layersByChar = parent.layersByChar
+        node.heuristic = len(node.string) - node.ptr
+        node.prio = (cost + node.heuristic, node.heuristic)
+        return node
+
+    @property
+    def solution(self):
+        res = []
+        node = self
+        while node.parent is not None:
+            res.append(node.sym)
+            node = node.parent
+        res.extend(reversed(node.path))
+        res.reverse()
+        return res
+
+    def successors(self):
+        res = []
+        #we can align the next char at any position it matches
+        #or give it its own symbol
+        nextChar = self.string[self.ptr]
+        for layer in self.layersByChar.get(nextChar, ()):
+            if layer < self.layer:
+                res.append(ExtendAlignNode.extend(self, self.cost, layer, layer))
+
+        res.append(ExtendAlignNode.extend(self, self.cost + 1, self.layer, "NSYM"))
+
+        return res
+
+    def __str__(self):
+        res = "[%d/%d] " % (self.cost, self.heuristic)
+        for (si, pi) in zip(self.string, self.solution):
+            res += "%s:%d " % (si, pi)
+        return res
+
+    def complete(self):
+        return self.ptr == len(self.string)
+
+    def key(self):
+        return self.ptr, self.path
+
+    def priority(self):
+        return self.prio
+
+    def __eq__(self, other):
+        return self.key() == other.key()
+
+    def __lt__(self, other):
+        return (self.prio < other.prio)
+
+    def computeHeuristic(self):
+        #one per char still to place; matching chars with the existing layers never lowered this bound
+        return len(self.string) - self.ptr
+
+class IncrementalAlignment:
+    """Layers of an alignment that strings are merged into one at a time
+
+    Layers are kept in a list, bottom to top, and each aligned string as
+    the ids of its layers, so a new symbol is inserted into the list
+    without rewriting the strings aligned before it. Symbol numbers are
+    only worked out when needed: a layer's number is its base plus the
+    number of new symbols inserted below it, which gives the same numbers
+    as shifting every symbol above each new one up by one."""
+
+    def __init__(self, strs, extracted):
+        charAtLayer = {}
+        for si, sol in zip(strs, extracted):
+            for ch, layer in zip(si, sol):
+                assert(charAtLayer.get(layer, ch) == ch)
+                charAtLayer[layer] = ch
+
+        #parallel lists, bottom to top: layer id, base, whether it is a new symbol, char
+        self.ids = sorted(charAtLayer)
+        self.bases = list(self.ids)
+        self.new = [False for layer in self.ids]
+        self.chars = [charAtLayer[layer] for layer in self.ids]
+        self.nextId = max(self.ids, default=0) + 1
+        self.rows = [list(sol) for sol in extracted]
+
+    def numbers(self):
+        """Current number of every layer, bottom to top"""
+        res = []
+        below = 0
+        for base, new in zip(self.bases, self.new):
+            res.append(base + below)
+            below += new
+        return res
+
+    def number(self, pos):
+        """Current number of the layer at position pos"""
+        return self.bases[pos] + sum(self.new[:pos])
+
+    def insert(self, pos, number, ch):
+        """Adds a new symbol with the given number at position pos and returns its id"""
+        newId = self.nextId
+        self.nextId += 1
+        self.ids.insert(pos, newId)
+        self.bases.insert(pos, number - sum(self.new[:pos]))
+        self.new.insert(pos, True)
+        self.chars.insert(pos, ch)
+        return newId
+
+    def merge(self, string):
+        numbers = self.numbers()
+        node = ExtendAlignNode(0, 0, max(numbers) + 1, [], string, dict(zip(numbers, self.chars)))
+        best = BestFirst(node, incremental_stats)
+
+        #later chars sit on lower layers than earlier ones, and new symbols go just below the layer of
+        #the previous char, so inserting one never moves the layers the rest of the string uses
+        position = {number: pos for pos, number in enumerate(numbers)}
+        row = []
+        prev = None
+        for ii, sym in enumerate(best.solution):
+            if sym != "NSYM":
+                prev = position[sym]
+            elif ii == 0:
+                prev = len(self.ids)
+                row.append(self.insert(prev, self.number(prev - 1) + 1, string[ii]))
+                continue
+            else:
+                row.append(self.insert(prev, self.number(prev), string[ii]))
+                continue
+            row.append(self.ids[prev])
+
+        self.rows.append(row)
+
+    def extracted(self):
+        """The aligned strings as lists of symbol numbers"""
+        byId = dict(zip(self.ids, self.numbers()))
+        return [[byId[layer] for layer in row] for row in self.rows]
+
+def incrementalMerge(string, ind, strs, extracted):
+    alignment = IncrementalAlignment(strs, extracted)
+    alignment.merge(string)
+    extracted[:] = alignment.extracted()
+
+#searches run, nodes expanded, incumbents, largest cost gap etc. of the budgeted alignments of selectAndAlign
+#(see SearchCore.py)
+anytime_stats = SearchCounters("anytime multialign")
+
+##Anytime search for a cheapest complete node from node within a budget of expansions and/or seconds
+##Returns the best complete node found and its gap: how much cheaper than it a solution could still be (see BestFirst)
+def anytimeSearch(node, expansions=None, seconds=None, weight=2.0):
+    return BestFirst(node, anytime_stats, cutoff=expansions, seconds=seconds, weight=weight)
+
+##Aligns the first nSelect distinguishers and returns how many were aligned, their alignment and its cost gap
+##Without a budget, a search that takes more than 5000 steps is abandoned and retried with half as many
+##distinguishers, and from 4 distinguishers on without a step limit. With a budget (expansions and/or seconds),
+##the first nSelect distinguishers are aligned by a single anytimeSearch, which returns the best alignment
+##it found within the budget and its gap; without a budget the alignment is optimal and the gap 0.
+def selectAndAlign(dists, verbose=False, nSelect=10, expansions=None, seconds=None):
+    if expansions is not None or seconds is not None:
+        select = min(len(dists), nSelect)
+        core = dists[:select]
+        mx1 = MultiAlignNode(0, core, [0 for xx in range(len(core))], prev=None, action=[])
+        sol, gap = anytimeSearch(mx1, expansions=expansions, seconds=seconds)
+        if verbose:
+            print("\tAligned", select, "distinguishers with cost gap", gap)
+        return select, extract(sol), gap
+
+    #I've also tried 25 as the initial selection
+    if dists:
+        maxSteps = 5000
+    else:
+        maxSteps = 100
+    select = min(len(dists), nSelect)
+    sol = None
+    while True:
+        if verbose:
+            print("\tChecking with", select, "distinguishers")
+        core = dists[:select]
+        mx1 = MultiAlignNode(0, core, [0 for xx in range(len(core))], prev=None, action=[])
+        sol = aStar(mx1, verbose=verbose, cutoff=maxSteps)
+        if sol is not None:
+            break
+
+        if select > 4:
+            select = select // 2
+        else:
+            maxSteps = None
+        
+    extracted = extract(sol)
+    return select, extracted, 0
+
+##Aligns the distinguishers dists in the order given and returns the alignment and the cost gap of selectAndAlign
+##expansions and seconds give selectAndAlign a budget (default: none)
+def alignDistinguishers(dists, expansions=None, seconds=None):
+    original = list(enumerate(dists))
+    byLength = sorted(original, key=lambda xx: len(xx[1]), reverse=True)
+    dists = [xx[1] for xx in byLength]
+    order = [xx[0] for xx in byLength]
+
+    verbose = False #len(dists) > 25
+    if verbose:
+        print(len(dists), "distinguishers to process")
+
+    select, extracted, gap = selectAndAlign(dists, verbose=verbose, expansions=expansions, seconds=seconds)
+    core = dists[:select]
+    remaining = dists[select:]
+
+    if verbose:
+        print("\tFound initial solution with", select, "elements")
+    #printAlignment2(core, extracted)
+
+    alignment = IncrementalAlignment(core, extracted)
+    for ii in range(select, len(dists)):
+        si = dists[ii]
+        #print("adding", si)
+
+        alignment.merge(si)
+        #print()
+        #printAlignment2(dists[:ii + 1], alignment.extracted())
+        #print()
+
+    extracted = alignment.extracted()
+
+    final = [None for xx in original]
+    for index, sol in zip(order, extracted):
+        final[index] = sol
+
+    return final, gap
+
+#bump when a code change alters the alignments, so that stored alignments are not reused
+MULTIALIGN_VERSION = 1
+
+##True if the next line of the open store file is the header of this MULTIALIGN_VERSION
+def _CurrentStore(storefile):
+    try:
+        return json.loads(storefile.readline()).get("version") == MULTIALIGN_VERSION
+    except (ValueError, AttributeError):
+        return False
+
+##Yields the offset, line and record of every complete record of an open store file, from the current position on
+def _StoreRecords(storefile):
+    offset = storefile.tell()
+    for line in storefile:
+        if line.endswith(b"\n"):
+            try:
+                yield offset, line, json.loads(line)
+            except ValueError:
+                pass
+        offset += len(line)
+
+class AlignmentStore:
+    """Append-only file of the alignments computed by approximateMultialign
+
+    The file holds a header line with MULTIALIGN_VERSION and one JSON line
+    per alignment, keyed by the sorted distinguishers. Only the byte
+    offset of each line is kept in memory; get reads the line back. Each
+    line goes out in a single unbuffered write, and a truncated line is
+    ignored when the file is read back; a file written by another version
+    is started afresh.
+
+    Only the process that opened the store writes to its file. A forked
+    worker process writes to a file of its own (the path plus its process
+    id), which merge moves into the store file once the workers are done.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.owner = os.getpid()
+        self.index = {}
+        self.side = None
+        self.reader = None
+        self.readerPid = None
+
+        current = False
+        ended = True
+        if os.path.exists(path):
+            with open(path, "rb") as storefile:
+                current = _CurrentStore(storefile)
+                if current:
+                    for offset, line, record in _StoreRecords(storefile):
+                        self.index[tuple(record["dists"])] = (offset, len(line))
+                    storefile.seek(0, os.SEEK_END)
+                    if storefile.tell() > 0:
+                        storefile.seek(-1, os.SEEK_END)
+                        ended = storefile.read(1) == b"\n"
+
+        if current:
+            self.out = open(path, "ab", buffering=0)
+            if not ended:
+                self.out.write(b"\n")
+        else:
+            self.out = open(path, "wb", buffering=0)
+            self.out.write((json.dumps({"version": MULTIALIGN_VERSION}) + "\n").encode("utf8"))
+        self.merge()
+
+    def __len__(self):
+        return len(self.index)
+
+    def get(self, key):
+        entry = self.index.get(key)
+        if entry is None:
+            return None
+
+        #a forked worker opens its own reader, as a file position is shared with the parent
+        if self.readerPid != os.getpid():
+            self.reader = open(self.path, "rb")
+            self.readerPid = os.getpid()
+        offset, length = entry
+        self.reader.seek(offset)
+        return json.loads(self.reader.read(length))["alignment"]
+
+    def put(self, key, alignment):
+        line = (json.dumps({"dists": list(key), "alignment": alignment}, ensure_ascii=False) + "\n").encode("utf8")
+        if os.getpid() == self.owner:
+            self.index[key] = (self.out.tell(), len(line))
+            self.out.write(line)
+        else:
+            if self.side is None:
+                self.side = open("%s.%d" % (self.path, os.getpid()), "wb", buffering=0)
+                self.side.write((json.dumps({"version": MULTIALIGN_VERSION}) + "\n").encode("utf8"))
+            self.side.write(line)
+
+    ##Moves the alignments that worker processes wrote to their own files into the store file
+    def merge(self):
+        for sidepath in sorted(glob.glob(glob.escape(self.path) + ".*")):
+            if not sidepath[len(self.path) + 1:].isdigit():
+                continue
+            with open(sidepath, "rb") as sidefile:
+                if _CurrentStore(sidefile):
+                    for offset, line, record in _StoreRecords(sidefile):
+                        key = tuple(record["dists"])
+                        if key not in self.index:
+                            self.index[key] = (self.out.tell(), len(line))
+                            self.out.write(line)
+            os.remove(sidepath)
+
+#alignments by sorted distinguishers, shared by every module that imports approximateMultialign
+#bounded by MULTIALIGN_CACHE_ENTRIES; MULTIALIGN_CACHE_FILE names a file that keeps them across runs, which is only
+#opened by the main process (forked workers inherit it)
+multialign_cache = AlignmentCache(CacheBound("MULTIALIGN_CACHE_ENTRIES", 100000), None)
+multialign_store = None
+if os.environ.get("MULTIALIGN_CACHE_FILE") and multiprocessing.current_process().name == "MainProcess":
+    multialign_store = AlignmentStore(os.environ["MULTIALIGN_CACHE_FILE"])
+
+##Returns the alignment of the distinguishers dists, one list of symbols per distinguisher in the order of dists, and
+##its cost gap: how much cheaper the exact alignment of the first distinguishers could be under a budget (else 0)
+##Many rows share the same distinguishers for a set of columns, possibly in another order, so the distinguishers are
+##aligned in sorted order and the result is memoised under them (and kept in multialign_store, if any), then put back
+##in the caller's order; the result thus does not depend on the order of dists.
+##An alignment under a budget (see selectAndAlign) is neither memoised nor taken from the memo.
+def approximateMultialign(dists, expansions=None, seconds=None):
+    order = sorted(range(len(dists)), key=lambda ii: dists[ii])
+    key = tuple([dists[ii] for ii in order])
+
+    gap = 0
+    if expansions is not None or seconds is not None:
+        aligned, gap = alignDistinguishers(list(key), expansions, seconds)
+    else:
+        aligned = multialign_cache.get(key)
+        if aligned is None:
+            if multialign_store is not None:
+                aligned = multialign_store.get(key)
+            if aligned is None:
+                aligned, gap = alignDistinguishers(list(key))
+                if multialign_store is not None:
+                    multialign_store.put(key, aligned)
+            multialign_cache.put(key, aligned)
+
+    final = [None for xx in dists]
+    for ii, sol in zip(order, aligned):
+        final[ii] = list(sol)
+
+    return final, gap
+
+if __name__ == "__main__":
+    dists = pickle.load(open(sys.argv[1], 'rb'))
+    print(len(dists))
+    print(dists)
+
+    sol, gap = approximateMultialign(dists)
+    print("final cost", max([ex[0] for ex in sol if ex]))
+    print(sol)
+    printAlignment2(dists, sol)
+
+    reduceAdjacentSymbols(sol)
+    assert(0)
+
+    print("real alignment")
+
+    mx1 = MultiAlignNode(0, dists, [0 for xx in range(len(dists))], prev=None, action=[])
+    sol = aStar(mx1, verbose=1, cutoff=None)
+    print(sol)
@@ -1,128 +1,223 @@
-import pulp
-
-def maxUnifiedMatching(rowA, rowB):
-    """Assume each row is list of list of int, 1 sublist per column
-    Match as many sublists as possible; all terms within the column
-    have to match."""
-
-    asyms = set()
-    for col in rowA:
-        asyms.update(col)
-
-    bsyms = set()
-    for col in rowB:
-        bsyms.update(col)
-
-    #step 1: define problem variables
-    #---------------------------------
-    #let m_i = 1 if column i matches
-    ms = []
-    for col in range(len(rowA)):
-        ms.append(pulp.LpVariable("m_%d" % col,
-                                  0, 1, "Binary"))
-
-    #let x_{ij} = 1 if symbol i matches symbol j
-    syms = {}
-    for sa in asyms:
-        for sb in bsyms:
-            syms[sa, sb] = pulp.LpVariable("x_%d_%d" % (sa, sb),
-                                           0, 1, "Binary")
-
-    #step 2: set up objective
-    #--------------------------
-    #we want to maximize the number of matched items
-    problem = pulp.LpProblem("maxmatch", pulp.LpMaximize)
-    problem += sum(ms)
-    
-    #step 3: set constraints
-    #------------------------
-
-    #if we match a column, we must match all its terms
-    #we can express this as m_i <= x_{sj,sk} for all sj, sk in the column
-    #this means if we make m_i = 1, all the xs have to be 1 as well
-    
-    for col, (cA, cB) in enumerate(zip(rowA, rowB)):
-        if len(cA) != len(cB):
-            problem.add( ms[col] == 0)
-        else:
-            for sA, sB in zip(cA, cB):
-                problem.add( ms[col] <= syms[sA, sB])
-
-    #no more than one sb can correspond to any sa
-    for sa in asyms:
-        allVars = []
-        for sb in bsyms:
-            allVars.append(syms[sa, sb])
-        
-        if allVars:
-            problem.add( sum(allVars) <= 1)
-
-    #and vice-versa
-    for sb in bsyms:
-        allVars = []
-        for sa in asyms:
-            allVars.append(syms[sa, sb])
-
-        if allVars:
-            problem.add( sum(allVars) <= 1)
-
-
-    #step 4: press the button and pray
-    problem.solve()
-    status = pulp.LpStatus[problem.status]
-    assert(status == "Optimal")
-
-    #step 5: figure out what happened-- which columns are included in solution?
-    res = []
-    
-    for ii, mi in enumerate(ms):
-        if mi.varValue > 0:
-            res.append(ii)
-
-    return res
-
-if __name__ == "__main__":
-    #trivially matches
-    rowA = [[1, 2], [2, 3], [3, 4]]
-    rowB = [[1, 2], [2, 3], [3, 4]]
-
-    match = maxUnifiedMatching(rowA, rowB)
-    print(match)
-
-    #trivially matches
-    rowA = [[1, 2], [2, 3], [3, 4]]
-    rowB = [[9, 10], [10, 11], [11, 12]]
-
-    match = maxUnifiedMatching(rowA, rowB)
-    print(match)
-
-    #only one matches
-    rowA = [[1, 2], [2, 3], [3, 4]]
-    rowB = [[9, 10], [9, 10], [9, 10]]
-
-    match = maxUnifiedMatching(rowA, rowB)
-    print(match)
-
-    #two match
-    rowA = [[1, 2], [2, 3], [3, 4]]
-    rowB = [[9, 10], [10, 11], [9, 10]]
-
-    match = maxUnifiedMatching(rowA, rowB)
-    print(match)
-
-    #three match
-    rowA = [[1, 2], [2, 3], [3, 4], [1, 4]]
-    rowB = [[9, 10], [10, 11], [12, 11], [9, 11]]
-
-    match = maxUnifiedMatching(rowA, rowB)
-    print(match)
-
-    #rowA = [[2, 1], [2, 1]]
-    #rowB = [[4, 2, 1], [3, 2, 1]]
-    #match = maxUnifiedMatching(rowA, rowB)
-    #print(match)
-    
-    #rowA = [[], []]
-    #rowB = [[4, 3, 1], [3, 2, 1]]
-    #match = maxUnifiedMatching(rowA, rowB)
-    #print(match)
+import pulp
+
+#components with at most this many columns are solved by exhaustive search, without starting the solver
+DIRECT_COLUMNS = 16
+
+#calls to maxUnifiedMatching, columns dropped or fixed by the presolve, components solved directly and solver runs
+presolve_stats = {"calls": 0, "dropped": 0, "fixed": 0, "direct": 0, "solved": 0}
+
+def columnMaps(cA, cB):
+    """Symbol correspondences of one column as a pair of dicts (a to b,
+    b to a), or None if the column cannot match: its two sides differ
+    in length, or it maps one symbol to two"""
+    if len(cA) != len(cB):
+        return None
+
+    forward = {}
+    backward = {}
+    for sA, sB in zip(cA, cB):
+        if forward.setdefault(sA, sB) != sB or backward.setdefault(sB, sA) != sA:
+            return None
+
+    return forward, backward
+
+def findConflicts(maps):
+    """For every column, the set of columns it cannot match together with.
+    Two columns conflict when they map one symbol to different symbols;
+    columns that agree pairwise can all match under one mapping."""
+    conflicts = {col: set() for col in maps}
+
+    for side in range(2):
+        #columns using each symbol, grouped by what they map it to
+        users = {}
+        for col, colmaps in maps.items():
+            for sym, image in colmaps[side].items():
+                users.setdefault(sym, {}).setdefault(image, []).append(col)
+
+        for images in users.values():
+            if len(images) > 1:
+                groups = list(images.values())
+                for ix, group in enumerate(groups):
+                    for other in groups[ix + 1:]:
+                        for colA in group:
+                            conflicts[colA].update(other)
+                            for colB in other:
+                                conflicts[colB].add(colA)
+
+    return conflicts
+
+def components(conflicts):
+    """Splits the columns into groups with no conflicts between groups"""
+    seen = set()
+    res = []
+    for start in sorted(conflicts):
+        if start in seen:
+            continue
+        seen.add(start)
+        comp = [start]
+        for col in comp:
+            for other in conflicts[col]:
+                if other not in seen:
+                    seen.add(other)
+                    comp.append(other)
+        res.append(sorted(comp))
+
+    return res
+
+def solveDirect(comp, conflicts):
+    """Largest set of columns of comp with no conflicts between them, by
+    exhaustive search cut by the columns left to decide"""
+    best = [[]]
+
+    def expand(chosen, rest):
+        if len(chosen) + len(rest) <= len(best[0]):
+            return
+        if not rest:
+            best[0] = chosen
+            return
+
+        col = rest[0]
+        expand(chosen + [col], [other for other in rest[1:] if other not in conflicts[col]])
+        expand(chosen, rest[1:])
+
+    expand([], comp)
+    return best[0]
+
+def solveILP(comp, maps, solver=None):
+    """Largest set of columns of comp that one mapping matches, by integer
+    linear program"""
+
+    #step 1: define problem variables
+    #---------------------------------
+    #let m_i = 1 if column i matches
+    ms = {}
+    for col in comp:
+        ms[col] = pulp.LpVariable("m_%d" % col, 0, 1, "Binary")
+
+    #let x_{ij} = 1 if symbol i matches symbol j, only for symbols that occur together in some column
+    syms = {}
+    for col in comp:
+        for sa, sb in maps[col][0].items():
+            if (sa, sb) not in syms:
+                syms[sa, sb] = pulp.LpVariable("x_%d" % len(syms), 0, 1, "Binary")
+
+    #step 2: set up objective
+    #--------------------------
+    #we want to maximize the number of matched items
+    problem = pulp.LpProblem("maxmatch", pulp.LpMaximize)
+    problem += sum(ms.values())
+
+    #step 3: set constraints
+    #------------------------
+
+    #if we match a column, we must match all its terms
+    #we can express this as m_i <= x_{sj,sk} for all sj, sk in the column
+    #this means if we make m_i = 1, all the xs have to be 1 as well
+    for col in comp:
+        for sa, sb in maps[col][0].items():
+            problem.add( ms[col] <= syms[sa, sb])
+
+    #no more than one sb can correspond to any sa, and vice-versa
+    bya = {}
+    byb = {}
+    for (sa, sb), var in syms.items():
+        bya.setdefault(sa, []).append(var)
+        byb.setdefault(sb, []).append(var)
+
+    for allVars in list(bya.values()) + list(byb.values()):
+        if len(allVars) > 1:
+            problem.add( sum(allVars) <= 1)
+
+    #step 4: press the button and pray
+    problem.solve(solver)
+    status = pulp.LpStatus[problem.status]
+    assert(status == "Optimal")
+
+    #step 5: figure out what happened-- which columns are included in solution?
+    return [col for col in comp if ms[col].varValue > 0]
+
+def maxUnifiedMatching(rowA, rowB, solver=None):
+    """Assume each row is list of list of int, 1 sublist per column
+    Match as many sublists as possible; all terms within the column
+    have to match.
+    solver: pulp solver to use (default: pulp's default solver)
+
+    Before any program is built, the problem is reduced: columns that
+    cannot match are dropped, columns that conflict with no other column
+    are fixed as matching, and the rest is split into groups of columns
+    with no conflicts between groups. Each group is solved on its own,
+    the small ones by exhaustive search without starting the solver."""
+    presolve_stats["calls"] += 1
+
+    maps = {}
+    for col, (cA, cB) in enumerate(zip(rowA, rowB)):
+        colmaps = columnMaps(cA, cB)
+        if colmaps is None:
+            presolve_stats["dropped"] += 1
+        else:
+            maps[col] = colmaps
+
+    conflicts = findConflicts(maps)
+
+    res = []
+    for col in list(conflicts):
+        if not conflicts[col]:
+            res.append(col)
+            del conflicts[col]
+            presolve_stats["fixed"] += 1
+
+    for comp in components(conflicts):
+        if len(comp) <= DIRECT_COLUMNS:
+            presolve_stats["direct"] += 1
+            res += solveDirect(comp, conflicts)
+        else:
+            presolve_stats["solved"] += 1
+            res += solveILP(comp, maps, solver)
+
+    return sorted(res)
+
+if __name__ == "__main__":
+    #trivially matches
+    rowA = [[1, 2], [2, 3], [3, 4]]
+    rowB = [[1, 2], [2, 3], [3, 4]]
+
+    match = maxUnifiedMatching(rowA, rowB)
+    print(match)
+
+    #trivially matches
+    rowA = [[1, 2], [2, 3], [3, 4]]
+    rowB = [[9, 10], [10, 11], [11, 12]]
+
+    match = maxUnifiedMatching(rowA, rowB)
+    print(match)
+
+    #only one matches
+    rowA = [[1, 2], [2, 3], [3, 4]]
+    rowB = [[9, 10], [9, 10], [9, 10]]
+
+    match = maxUnifiedMatching(rowA, rowB)
+    print(match)
+
+    #two match
+    rowA = [[1, 2], [2, 3], [3, 4]]
+    rowB = [[9, 10], [10, 11], [9, 10]]
+
+    match = maxUnifiedMatching(rowA, rowB)
+    print(match)
+
+    #three match
+    rowA = [[1, 2], [2, 3], [3, 4], [1, 4]]
+    rowB = [[9, 10], [10, 11], [12, 11], [9, 11]]
+
+    match = maxUnifiedMatching(rowA, rowB)
+    print(match)
+
+    #rowA = [[2, 1], [2, 1]]
+    #rowB = [[4, 2, 1], [3, 2, 1]]
+    #match = maxUnifiedMatching(rowA, rowB)
+    #print(match)
+    
+    #rowA = [[], []]
+    #rowB = [[4, 3, 1], [3, 2, 1]]
+    #match = maxUnifiedMatching(rowA, rowB)
+    #print(match)
@@ -0,0 +1,152 @@
+from SearchCore import SearchCounters, BestFirst
+
+#Exact multialignment of distinguishers, used by approximateMultialign.py
+#
+#The strings are aligned into columns: every column holds at most one char of each string, all the same char, and
+#the chars of a string keep their order. The cost of an alignment is its number of columns, so the cheapest one
+#spells a shortest common supersequence of the strings. Columns are numbered from the last (1) to the first, so
+#along every string the numbers go down; approximateMultialign.py extends such alignments one string at a time.
+
+#searches run, nodes expanded, successors generated etc. by aStar (see SearchCore.py)
+multialign_stats = SearchCounters("multialign")
+
+class MultiAlignNode:
+    """Search node for aligning strings into columns
+
+    ptrs holds how many chars of each string are aligned so far. A step
+    opens a new column for one char and puts in it the next char of every
+    string whose next char it is (taking fewer of them never gives a
+    cheaper alignment). prev and action are the parent node and the
+    column that led here: its char and the strings it advanced."""
+
+    __slots__ = ("cost", "strings", "ptrs", "prev", "action", "heuristic", "prio", "valid")
+
+    def __init__(self, cost, strings, ptrs, prev=None, action=[]):
+        self.cost = cost
+        self.strings = strings
+        self.ptrs = ptrs
+        self.prev = prev
+        self.action = action
+        self.heuristic = self.computeHeuristic()
+        self.prio = (self.cost + self.heuristic, self.heuristic)
+
+    def computeHeuristic(self):
+        #a char still needs as many columns as the string with the most of it has left
+        most = {}
+        for string, ptr in zip(self.strings, self.ptrs):
+            counts = {}
+            for ch in string[ptr:]:
+                counts[ch] = counts.get(ch, 0) + 1
+            for ch, ct in counts.items():
+                if ct > most.get(ch, 0):
+                    most[ch] = ct
+
+        return sum(most.values())
+
+    def successors(self):
+        res = []
+        byChar = {}
+        for ii, (string, ptr) in enumerate(zip(self.strings, self.ptrs)):
+            if ptr < len(string):
+                byChar.setdefault(string[ptr], []).append(ii)
+
+        for ch, advanced in byChar.items():
+            ptrs = list(self.ptrs)
+            for ii in advanced:
+                ptrs[ii] += 1
+            res.append(MultiAlignNode(self.cost + 1, self.strings, ptrs, prev=self, action=(ch, advanced)))
+
+        return res
+
+    def complete(self):
+        for string, ptr in zip(self.strings, self.ptrs):
+            if ptr < len(string):
+                return False
+        return True
+
+    def key(self):
+        return tuple(self.ptrs)
+
+    def priority(self):
+        return self.prio
+
+    def reweight(self, weight):
+        self.prio = (self.cost + weight * self.heuristic, self.heuristic)
+
+    def __eq__(self, other):
+        return self.key() == other.key()
+
+    def __lt__(self, other):
+        return (self.prio < other.prio)
+
+    def __str__(self):
+        return "[%d/%d] %s" % (self.cost, self.heuristic, self.ptrs)
+
+##Returns the cheapest complete node reachable from node, or None if the search passes cutoff expansions
+##(or seconds, if given)
+def aStar(node, verbose=False, cutoff=None, seconds=None):
+    expanded = multialign_stats["expanded"]
+    best = BestFirst(node, multialign_stats, verbose=verbose, cutoff=cutoff, seconds=seconds)
+
+    if verbose:
+        if best is None:
+            print("stopped after", multialign_stats["expanded"] - expanded, "steps")
+        else:
+            print("finished in", multialign_stats["expanded"] - expanded, "steps with cost", best.cost)
+
+    return best
+
+##Returns the alignment of a complete node: for every string, the number of the column of each of its chars
+##The first column gets the highest number and the last column 1
+def extract(node):
+    actions = []
+    while node.prev is not None:
+        actions.append(node.action)
+        node = node.prev
+
+    res = [[] for string in node.strings]
+    for column, (ch, advanced) in enumerate(actions, start=1):
+        for ii in advanced:
+            res[ii].append(column)
+
+    for sol in res:
+        sol.reverse()
+
+    return res
+
+##Prints the strings one above the other, each char in its column and - where a string has none
+def printAlignment2(strs, sol):
+    ncols = max([max(syms) for syms in sol if syms], default=0)
+    for string, syms in zip(strs, sol):
+        row = ["-" for col in range(ncols)]
+        for ch, sym in zip(string, syms):
+            row[ncols - sym] = ch
+        print(" ".join(row))
+
+##Merges neighbouring columns that no string has chars in both of, renumbering the alignment sol in place
+##Returns how many columns were merged away
+##The merged alignment keeps the order of the chars of every string, but a column may then hold different chars
+def reduceAdjacentSymbols(sol):
+    ncols = max([max(syms) for syms in sol if syms], default=0)
+    users = [set() for col in range(ncols + 1)]
+    for ii, syms in enumerate(sol):
+        for sym in syms:
+            users[sym].add(ii)
+
+    #from the first column down, a column joins the group above it unless one of its strings is already there
+    groupOf = [0 for col in range(ncols + 1)]
+    ngroups = 0
+    group = None
+    for col in range(ncols, 0, -1):
+        if group is not None and not (group & users[col]):
+            group |= users[col]
+        else:
+            group = set(users[col])
+            ngroups += 1
+        groupOf[col] = ngroups
+
+    for syms in sol:
+        for jj, sym in enumerate(syms):
+            syms[jj] = ngroups - groupOf[sym] + 1
+
+    return ncols - ngroups
@@ -12,9 +12,11 @@
 #  Created by Laurens van der Maaten on 20-12-08.
 #  Copyright (c) 2008 Tilburg University. All rights reserved.
 
+import sys
 import numpy as np
 import pylab
 from sklearn import decomposition
+from Artifacts import LoadEntropyMatrix
 
 def Hbeta(D=np.array([]), beta=1.0):
     """
@@ -175,6 +177,17 @@ def tsne(X=np.array([]), no_dims=2, initial_dims=50, perplexity=30.0):
 
 if __name__ == "__main__":
     print("Run Y = tsne.tsne(X, no_dims, perplexity) to perform t-SNE on your dataset.")
+    if len(sys.argv) > 1:
+        # Embed the plat rows of an entropy matrix written by EntropyCalculations.py
+        print("Running on entropy matrix %s..." % sys.argv[1])
+        entropy = LoadEntropyMatrix(sys.argv[1])
+        X = np.asarray(entropy.matrix)
+        Y = tsne(X, 2, 50, min(20.0, (X.shape[0] - 1) / 3.0))
+        pylab.scatter(Y[:, 0], Y[:, 1], 20)
+        for label, (x, y) in zip(entropy.rows, Y):
+            pylab.annotate(label, (x, y), fontsize=6)
+        pylab.show()
+        sys.exit(0)
     print("Running example on 2,500 MNIST digits...")
     X = np.loadtxt("mnist2500_X.txt")
     labels = np.loadtxt("mnist2500_labels.txt")